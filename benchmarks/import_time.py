@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) 2012, Machinalis S.R.L.
+# This file is part of quepy and is distributed under the Modified BSD License.
+# You should have received a copy of license in the LICENSE file.
+#
+# Authors: Rafael Carrascosa <rcarrascosa@machinalis.com>
+#          Gonzalo Garcia Berrotaran <ggarcia@machinalis.com>
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+"""
+Measures the time taken by `import quepy` using `python -X importtime`.
+
+Usage:
+    python benchmarks/import_time.py [budget_ms]
+
+Prints the median cumulative import time of quepy over several runs and the
+slowest modules it pulls in. Exits with status 1 when the median is over
+`budget_ms` (default 100), so it can guard against import-time regressions.
+"""
+
+import os
+import re
+import sys
+import subprocess
+
+RUNS = 7
+_line = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def measure():
+    """
+    Returns a dict from module name to cumulative import time in
+    microseconds for a single `import quepy`.
+    """
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    call = subprocess.Popen(
+        [sys.executable, "-X", "importtime", "-c", "import quepy"],
+        stderr=subprocess.PIPE, cwd=root)
+    _, output = call.communicate()
+
+    times = {}
+    for line in output.decode("utf-8").splitlines():
+        match = _line.match(line)
+        if match:
+            times[match.group(4)] = int(match.group(2))
+    return times
+
+
+def main(budget_ms):
+    runs = [measure() for _ in range(RUNS)]
+    total = sorted(run["quepy"] for run in runs)[RUNS // 2]
+
+    slowest = sorted(runs[-1].items(), key=lambda item: -item[1])[1:11]
+    print("Slowest modules (last run):")
+    for name, micros in slowest:
+        print("  {:<40} {:>8.1f} ms".format(name, micros / 1000.0))
+
+    print("import quepy: {:.1f} ms (median of {} runs, budget {} ms)".format(
+        total / 1000.0, RUNS, budget_ms))
+    return 0 if total / 1000.0 <= budget_ms else 1
+
+
+if __name__ == "__main__":
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else 100
+    sys.exit(main(budget))
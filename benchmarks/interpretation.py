@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) 2012, Machinalis S.R.L.
+# This file is part of quepy and is distributed under the Modified BSD License.
+# You should have received a copy of license in the LICENSE file.
+#
+# Authors: Rafael Carrascosa <rcarrascosa@machinalis.com>
+#          Gonzalo Garcia Berrotaran <ggarcia@machinalis.com>
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+"""
+Measures the time spent reading the words and particles of the matches of
+the dbpedia example app, with and without the caching done by
+`quepy.parsing.Match`.
+
+Usage:
+    python benchmarks/interpretation.py [repeat]
+
+For each example question that a template matches, every group and particle
+of the match is read `reads` times, as templates that use `match.movie`
+more than once do. Requires the tagger data.
+"""
+
+import sys
+import time
+
+from matching import load_app, report
+from quepy.parsing import Match, WordList, eol_terminated
+
+
+class UncachedMatch(Match):
+    """
+    `Match` as it was before caching: every access builds the words or
+    interprets the particle again.
+    """
+
+    @property
+    def words(self):
+        i, j = self._match.span()
+        if self._i is not None:
+            i, j = self._i, self._j
+        return WordList(self._words[i:j])
+
+    def __getattr__(self, attr):
+        value = super(UncachedMatch, self).__getattr__(attr)
+        del self.__dict__[attr]
+        return value
+
+
+def load_matches():
+    """
+    Returns `(words, refo match, attribute names)` for each example question
+    matched by a template.
+    """
+
+    app, tagged = load_app()
+    matches = []
+    for words in tagged:
+        sequence = eol_terminated(words)
+        for rule in app.rules:
+            match = rule.match(sequence)
+            if match:
+                names = [key.name if hasattr(key, "name") else key
+                         for key in match if key is not None]
+                matches.append((words, match, names))
+    return matches
+
+
+def read_all(cls, matches, reads):
+    for words, match, names in matches:
+        match = cls(match, words)
+        for _ in range(reads):
+            match.words.tokens
+            for name in names:
+                getattr(match, name)
+
+
+def timeit(cls, matches, reads, repeat):
+    start = time.time()
+    for _ in range(repeat):
+        read_all(cls, matches, reads)
+    return (time.time() - start) / (repeat * len(matches))
+
+
+def main(repeat):
+    matches = load_matches()
+    print("{} matches, {} runs".format(len(matches), repeat))
+    for reads in [1, 2, 3]:
+        print("\n{} read(s) of each attribute".format(reads))
+        before = timeit(UncachedMatch, matches, reads, repeat)
+        report("uncached", before)
+        after = timeit(Match, matches, reads, repeat)
+        report("cached", after, before)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
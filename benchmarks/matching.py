@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) 2012, Machinalis S.R.L.
+# This file is part of quepy and is distributed under the Modified BSD License.
+# You should have received a copy of license in the LICENSE file.
+#
+# Authors: Rafael Carrascosa <rcarrascosa@machinalis.com>
+#          Gonzalo Garcia Berrotaran <ggarcia@machinalis.com>
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+"""
+Measures the per-question time spent matching the templates of the dbpedia
+example app.
+
+Usage:
+    python benchmarks/matching.py [repeat]
+
+The questions are the examples in the docstrings of the templates. They are
+tagged once, so only matching is measured. Requires the tagger data.
+"""
+
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "examples", "dbpedia"))
+
+import refo
+import quepy
+from quepy.engines import CombinedEngine, RegexEngine, MemoEngine
+from quepy.parsing import eol_terminated, compile_regex, run_compiled, _EOL
+from quepy.tagger import TaggedSentence
+
+_example = re.compile('"(.*?)"')
+
+
+def load_app():
+    """
+    Returns the dbpedia app and the tagged examples of its templates.
+    """
+
+    app = quepy.install("dbpedia")
+    questions = []
+    for rule in app.rules:
+        questions.extend(_example.findall(rule.__doc__ or ""))
+    tagged = [TaggedSentence.from_words(app.tagger(question))
+              for question in questions]
+    return app, tagged
+
+
+def match_uncompiled(rules, words):
+    """
+    Matching as done before templates were compiled at install time.
+    """
+
+    for rule in rules:
+        refo.match(rule.regex + refo.Literal(_EOL), list(words) + [_EOL])
+
+
+def match_compiled(rules, words):
+    sequence = eol_terminated(words)
+    for rule in rules:
+        rule.match(sequence)
+
+
+def match_indexed(app, words):
+    sequence = eol_terminated(words)
+    for rule in app._rule_index.candidates(words):
+        rule.match(sequence)
+
+
+def match_engine(engine, words):
+    for _ in engine.matches(engine.rules, eol_terminated(words)):
+        pass
+
+
+def match_code(codes, words):
+    sequence = eol_terminated(words)
+    for code in codes:
+        run_compiled(code, sequence)
+
+
+def timeit(function, rules, tagged, repeat):
+    start = time.time()
+    for _ in range(repeat):
+        for words in tagged:
+            function(rules, words)
+    return (time.time() - start) / (repeat * len(tagged))
+
+
+def report(name, seconds, baseline=None):
+    line = "{:<12} {:>10.3f} ms/question".format(name, seconds * 1000)
+    if baseline is not None:
+        line += "  ({:.2f}x)".format(baseline / seconds)
+    print(line)
+
+
+def main(repeat):
+    app, tagged = load_app()
+    print("{} templates, {} questions, {} runs".format(
+        len(app.rules), len(tagged), repeat))
+
+    before = timeit(match_uncompiled, app.rules, tagged, repeat)
+    report("uncompiled", before)
+    after = timeit(match_compiled, app.rules, tagged, repeat)
+    report("compiled", after, before)
+    after = timeit(match_indexed, app, tagged, repeat)
+    report("indexed", after, before)
+    after = timeit(match_engine, CombinedEngine(app.rules), tagged, repeat)
+    report("combined", after, before)
+    after = timeit(match_engine, RegexEngine(app.rules), tagged, repeat)
+    report("regex", after, before)
+    after = timeit(match_engine, MemoEngine(app.rules), tagged, repeat)
+    report("memo", after, before)
+
+    # Effect of collapsing alternations like `Pos("NN") | Pos("NNS")` into
+    # set predicates, on the templates that use them the most
+    for module in ["dbpedia.movies", "dbpedia.music"]:
+        rules = [rule for rule in app.rules
+                 if type(rule).__module__ == module]
+        print("\n{} ({} templates)".format(module, len(rules)))
+        plain = [compile_regex(rule.regex, collapse=False) for rule in rules]
+        before = timeit(match_code, plain, tagged, repeat)
+        report("alternations", before)
+        collapsed = [compile_regex(rule.regex) for rule in rules]
+        after = timeit(match_code, collapsed, tagged, repeat)
+        report("sets", after, before)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) 2012, Machinalis S.R.L.
+# This file is part of quepy and is distributed under the Modified BSD License.
+# You should have received a copy of license in the LICENSE file.
+#
+# Authors: Rafael Carrascosa <rcarrascosa@machinalis.com>
+#          Gonzalo Garcia Berrotaran <ggarcia@machinalis.com>
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+"""
+Compares startup time and throughput of the tagging backends.
+
+Usage:
+    python benchmarks/tagging.py [repeat]
+
+Each backend runs in its own process, so startup includes importing the
+backend library and loading its models. Backends that can't be loaded
+(missing library or data) are reported as unavailable.
+"""
+
+import os
+import sys
+import json
+import time
+import subprocess
+
+QUESTIONS = [
+    "Who is Tom Cruise?",
+    "List movies directed by Quentin Tarantino.",
+    "How long is Pulp Fiction?",
+    "What is the capital of Bolivia?",
+    "Which movies did Mel Gibson direct?",
+    "What is the population of China?",
+    "Who wrote The Little Prince?",
+    "List albums of Pink Floyd",
+    "When was Gladiator released?",
+    "Who is the president of Argentina?",
+]
+
+
+def run_backend(name, repeat):
+    from quepy import settings, tagger
+
+    settings.TAGGER = name
+    questions = QUESTIONS * repeat
+
+    start = time.time()
+    pos_tagger = tagger.get_tagger()
+    # Forces lazily loaded models
+    pos_tagger(QUESTIONS[0])
+    startup = time.time() - start
+
+    start = time.time()
+    for question in questions:
+        pos_tagger(question)
+    single = time.time() - start
+
+    start = time.time()
+    for _ in pos_tagger.tag_many(questions):
+        pass
+    batch = time.time() - start
+
+    return {
+        "startup": startup,
+        "single": len(questions) / single,
+        "batch": len(questions) / batch,
+    }
+
+
+def main(repeat):
+    from quepy import tagger
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    line = "{:<10} {:>12} {:>16} {:>16}"
+    print(line.format("tagger", "startup (s)", "single (q/s)", "batch (q/s)"))
+
+    for name in sorted(tagger.TAGGERS):
+        call = subprocess.Popen(
+            [sys.executable, __file__, "--backend", name, str(repeat)],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=root)
+        output, _ = call.communicate()
+        if call.returncode != 0:
+            print(line.format(name, "unavailable", "", ""))
+            continue
+
+        result = json.loads(output.decode("utf-8"))
+        print(line.format(name, "{:.2f}".format(result["startup"]),
+                          "{:.0f}".format(result["single"]),
+                          "{:.0f}".format(result["batch"])))
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+
+    if len(sys.argv) > 2 and sys.argv[1] == "--backend":
+        repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+        print(json.dumps(run_backend(sys.argv[2], repeat)))
+    else:
+        repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+        main(repeat)
@@ -0,0 +1,363 @@
+# coding: utf-8
+
+# Copyright (c) 2012, Machinalis S.R.L.
+# This file is part of quepy and is distributed under the Modified BSD License.
+# You should have received a copy of license in the LICENSE file.
+#
+# Authors: Rafael Carrascosa <rcarrascosa@machinalis.com>
+#          Gonzalo Garcia Berrotaran <ggarcia@machinalis.com>
+
+from __future__ import absolute_import, unicode_literals
+
+"""
+Static analysis of regexes, used to avoid matching templates that can't
+match a question.
+
+A *literal* is a `(attribute, value)` pair, e.g. `("lemma", "movie")`, that
+a word satisfies when its attribute has that value.
+"""
+
+import logging
+from collections import defaultdict
+
+from refo import Predicate, Disjunction, Concatenation, Star, Plus, \
+    Question, Group, Repetition
+
+from .parsing import Pos, Lemma, Token, PosIn, LemmaIn, TokenIn
+
+logger = logging.getLogger("quepy.analysis")
+
+# Predicates whose literal is known. Subclasses are not included because
+# they may redefine what is checked.
+LITERAL_ATTRIBUTES = {Pos: "pos", Lemma: "lemma", Token: "token"}
+# Same, for predicates satisfied by any of a set of literals
+SET_ATTRIBUTES = {PosIn: "pos", LemmaIn: "lemma", TokenIn: "token"}
+
+# Bound to the number of clauses kept for a regex
+MAX_CLAUSES = 32
+
+
+def _simplify(clauses):
+    # Drops clauses implied by smaller ones and keeps at most MAX_CLAUSES,
+    # dropping clauses only makes the requirements weaker so it's safe.
+    result = []
+    for clause in sorted(clauses, key=len):
+        if not any(other <= clause for other in result):
+            result.append(clause)
+    return frozenset(result[:MAX_CLAUSES])
+
+
+def required_literals(regex):
+    """
+    Returns the literals that any sequence matched by `regex` must contain,
+    as a set of clauses: each clause is a frozenset of literals of which at
+    least one must be present.
+    E.g. `Lemma("list") + (Lemma("movie") | Lemma("film"))` gives
+    `{{("lemma", "list")}, {("lemma", "movie"), ("lemma", "film")}}`.
+    """
+
+    attribute = LITERAL_ATTRIBUTES.get(type(regex))
+    if attribute is not None:
+        return frozenset([frozenset([(attribute, regex.tag)])])
+
+    attribute = SET_ATTRIBUTES.get(type(regex))
+    if attribute is not None:
+        return frozenset([frozenset((attribute, tag) for tag in regex.tags)])
+
+    if isinstance(regex, Concatenation):
+        clauses = set()
+        for x in regex.xs:
+            clauses.update(required_literals(x))
+        return _simplify(clauses)
+
+    if isinstance(regex, Disjunction):
+        a = required_literals(regex.a)
+        b = required_literals(regex.b)
+        return _simplify(x | y for x in a for y in b)
+
+    if isinstance(regex, (Plus, Group)):
+        return required_literals(regex.x)
+
+    if isinstance(regex, Repetition) and regex.mn > 0:
+        return required_literals(regex.x)
+
+    # Star, Question, Any, Literal and unknown predicates require nothing
+    return frozenset()
+
+
+def _add(a, b):
+    if a is None or b is None:
+        return None
+    return a + b
+
+
+def length_bounds(regex):
+    """
+    Returns `(minimum, maximum)`, the number of words a sequence matched by
+    `regex` can have. `maximum` is `None` when unbounded.
+    """
+
+    if isinstance(regex, Predicate):
+        return 1, 1
+
+    if isinstance(regex, Concatenation):
+        minimum, maximum = 0, 0
+        for x in regex.xs:
+            xmin, xmax = length_bounds(x)
+            minimum += xmin
+            maximum = _add(maximum, xmax)
+        return minimum, maximum
+
+    if isinstance(regex, Disjunction):
+        amin, amax = length_bounds(regex.a)
+        bmin, bmax = length_bounds(regex.b)
+        if amax is None or bmax is None:
+            return min(amin, bmin), None
+        return min(amin, bmin), max(amax, bmax)
+
+    if isinstance(regex, Group):
+        return length_bounds(regex.x)
+
+    if isinstance(regex, (Star, Plus, Question, Repetition)):
+        xmin, xmax = length_bounds(regex.x)
+        if isinstance(regex, Star):
+            mn, mx = 0, None
+        elif isinstance(regex, Plus):
+            mn, mx = 1, None
+        elif isinstance(regex, Question):
+            mn, mx = 0, 1
+        else:
+            mn, mx = regex.mn, regex.mx
+
+        if xmax == 0:
+            return 0, 0
+        if mx is None or xmax is None:
+            return mn * xmin, None
+        return mn * xmin, mx * xmax
+
+    # Unknown pattern, can't be bounded
+    return 0, None
+
+
+def first_literals(regex):
+    """
+    Returns `(literals, nullable)`: the literals of which the first word of
+    a sequence matched by `regex` must satisfy at least one, or `None` if
+    any word can be first, and whether `regex` can match an empty sequence.
+    E.g. `Question(Lemma("list")) + Lemma("movie")` gives
+    `({("lemma", "list"), ("lemma", "movie")}, False)`.
+    """
+
+    attribute = LITERAL_ATTRIBUTES.get(type(regex))
+    if attribute is not None:
+        return frozenset([(attribute, regex.tag)]), False
+
+    attribute = SET_ATTRIBUTES.get(type(regex))
+    if attribute is not None:
+        return frozenset((attribute, tag) for tag in regex.tags), False
+
+    if isinstance(regex, Predicate):
+        # Any and unknown predicates
+        return None, False
+
+    if isinstance(regex, Concatenation):
+        literals = frozenset()
+        for x in regex.xs:
+            xliterals, nullable = first_literals(x)
+            if xliterals is None:
+                return None, False
+            literals |= xliterals
+            if not nullable:
+                return literals, False
+        return literals, True
+
+    if isinstance(regex, Disjunction):
+        aliterals, anullable = first_literals(regex.a)
+        bliterals, bnullable = first_literals(regex.b)
+        nullable = anullable or bnullable
+        if aliterals is None or bliterals is None:
+            return None, nullable
+        return aliterals | bliterals, nullable
+
+    if isinstance(regex, (Group, Plus)):
+        return first_literals(regex.x)
+
+    if isinstance(regex, (Star, Question)):
+        return first_literals(regex.x)[0], True
+
+    if isinstance(regex, Repetition):
+        literals, nullable = first_literals(regex.x)
+        return literals, nullable or regex.mn == 0
+
+    # Unknown pattern
+    return None, True
+
+
+def word_literals(words):
+    """
+    Returns the set of literals satisfied by the words of a question.
+    """
+
+    literals = set()
+    for word in words:
+        literals.add(("pos", word.pos))
+        literals.add(("lemma", word.lemma))
+        literals.add(("token", word.token))
+    return literals
+
+
+class FirstWordIndex(object):
+    """
+    Dispatch table from the first word of a question to the templates that
+    can start with it.
+
+    Each template is put in the bucket of every literal its first word may
+    satisfy (see `first_literals`), or in the fallback bucket when any word
+    can be first, e.g. templates starting with `Any` or `Star(Any())`.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._buckets = defaultdict(list)
+        self._fallback = []
+        for position, rule in enumerate(self.rules):
+            literals, _ = first_literals(rule.regex)
+            if literals is None:
+                self._fallback.append(position)
+                continue
+            for literal in literals:
+                self._buckets[literal].append(position)
+
+    def positions(self, words):
+        """
+        Returns the set of positions of the templates that may match
+        `words`.
+        """
+
+        if not len(words):
+            # Only templates that match an empty sequence can, let them be
+            return set(range(len(self.rules)))
+        word = words[0]
+        positions = set(self._fallback)
+        for literal in [("lemma", word.lemma), ("token", word.token),
+                        ("pos", word.pos)]:
+            positions.update(self._buckets.get(literal, ()))
+        return positions
+
+    def candidates(self, words):
+        """
+        Returns the templates that may match `words`, in the order they
+        were given.
+        """
+
+        return [self.rules[position]
+                for position in sorted(self.positions(words))]
+
+    def stats(self):
+        """
+        Returns the number of templates in each bucket, by
+        "attribute=value", and in the fallback bucket.
+        """
+
+        return {
+            "buckets": {"{}={}".format(attribute, value): len(positions)
+                        for (attribute, value), positions
+                        in self._buckets.items()},
+            "fallback": len(self._fallback),
+        }
+
+
+class RuleIndex(object):
+    """
+    Selects the templates that may match a question.
+
+    Candidates are looked up in an inverted index from literals to
+    templates: each template is indexed under the literals of its most
+    selective clause, templates that require nothing are always candidates.
+    Then the templates whose length bounds don't fit the number of words of
+    the question are discarded, and those that can't start with its first
+    word (see `FirstWordIndex`).
+    `candidates` returns the templates whose length fits, that can start
+    with the first word and whose clauses are all satisfied by a question,
+    in the order the templates were given.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._clauses = []
+        self._bounds = []
+        self._always = []
+        self._index = defaultdict(list)
+        self.first_words = FirstWordIndex(self.rules)
+
+        for position, rule in enumerate(self.rules):
+            self._bounds.append(length_bounds(rule.regex))
+            clauses = required_literals(rule.regex)
+            self._clauses.append(clauses)
+            if not clauses:
+                self._always.append(position)
+                continue
+            anchor = min(clauses, key=len)
+            for literal in anchor:
+                self._index[literal].append(position)
+
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.questions = 0
+        self.pruned_by_literals = 0
+        self.pruned_by_length = 0
+        self.pruned_by_first_word = 0
+
+    def stats(self):
+        """
+        Returns how many template matchings were avoided.
+        """
+
+        total = self.questions * len(self.rules)
+        pruned = self.pruned_by_literals + self.pruned_by_length + \
+            self.pruned_by_first_word
+        return {
+            "questions": self.questions,
+            "templates": len(self.rules),
+            "pruned_by_literals": self.pruned_by_literals,
+            "pruned_by_length": self.pruned_by_length,
+            "pruned_by_first_word": self.pruned_by_first_word,
+            "pruning_ratio": float(pruned) / total if total else 0.0,
+        }
+
+    def candidates(self, words):
+        """
+        Returns the templates that may match `words`.
+        """
+
+        length = len(words)
+        literals = word_literals(words)
+        positions = set(self._always)
+        for literal in literals:
+            positions.update(self._index.get(literal, ()))
+
+        first_word = self.first_words.positions(words)
+
+        result = []
+        by_length = 0
+        by_first_word = 0
+        for position in sorted(positions):
+            minimum, maximum = self._bounds[position]
+            if length < minimum or (maximum is not None and length > maximum):
+                by_length += 1
+            elif position not in first_word:
+                by_first_word += 1
+            elif all(not clause.isdisjoint(literals)
+                     for clause in self._clauses[position]):
+                result.append(self.rules[position])
+
+        self.questions += 1
+        self.pruned_by_length += by_length
+        self.pruned_by_first_word += by_first_word
+        self.pruned_by_literals += len(self.rules) - len(result) - \
+            by_length - by_first_word
+        logger.debug("Prefilter kept %d of %d templates (%d by length, "
+                     "%d by first word)", len(result), len(self.rules),
+                     by_length, by_first_word)
+        return result
@@ -0,0 +1,253 @@
+# coding: utf-8
+
+# Copyright (c) 2012, Machinalis S.R.L.
+# This file is part of quepy and is distributed under the Modified BSD License.
+# You should have received a copy of license in the LICENSE file.
+#
+# Authors: Rafael Carrascosa <rcarrascosa@machinalis.com>
+#          Gonzalo Garcia Berrotaran <ggarcia@machinalis.com>
+
+from __future__ import absolute_import, unicode_literals
+
+"""
+Small caches used to memoize tagging work.
+"""
+
+import time
+import threading
+from collections import OrderedDict, namedtuple
+
+from . import settings
+
+CacheInfo = namedtuple("CacheInfo", "hits misses maxsize currsize")
+
+# Returned by `get` when the key is not cached, `None` is a valid value
+MISSING = object()
+
+
+class LRUCache(object):
+    """
+    A mapping bounded to `maxsize` entries that evicts the least recently
+    used entry when full.
+    `maxsize` of `None` means unbounded and `0` disables caching.
+    Counts hits and misses.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Returns the value cached for `key` or `MISSING`.
+        """
+
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return MISSING
+        # Re-insert to mark it as the most recently used
+        self._data[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.maxsize == 0:
+            return
+        self._data.pop(key, None)
+        self._data[key] = value
+        if self.maxsize is not None and len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+
+class TTLCache(LRUCache):
+    """
+    A cache whose entries expire `ttl` seconds after being stored.
+    When full, the entry closest to expiring is evicted.
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600, timer=time.time):
+        super(TTLCache, self).__init__(maxsize)
+        self.ttl = ttl
+        self._timer = timer
+
+    def get(self, key):
+        try:
+            expires, value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return MISSING
+
+        if expires <= self._timer():
+            del self._data[key]
+            self.misses += 1
+            return MISSING
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._expire()
+        super(TTLCache, self).put(key, (self._timer() + self.ttl, value))
+
+    def _expire(self):
+        # Entries are kept in insertion order, which is also expiration order
+        now = self._timer()
+        while self._data:
+            key, (expires, _) = next(iter(self._data.items()))
+            if expires > now:
+                break
+            del self._data[key]
+
+
+class SQLiteCache(object):
+    """
+    A cache of tagged questions stored in an SQLite file, so it survives
+    restarts and can be shared by several processes.
+    Values must be sequences of `(token, lemma, pos, prob)` tuples, they are
+    stored as JSON.
+    When there are more than `maxsize` entries the oldest ones are removed,
+    this is checked every `prune_every` insertions.
+    """
+
+    def __init__(self, path, maxsize=None, timeout=30.0, prune_every=128):
+        self.path = path
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.prune_every = prune_every
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        # sqlite3 connections can't be shared between threads
+        self._local = threading.local()
+
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS tags ("
+                "question TEXT PRIMARY KEY, words TEXT NOT NULL, "
+                "stored REAL NOT NULL)")
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Imported here so importing quepy doesn't load sqlite
+            import sqlite3
+            connection = sqlite3.connect(self.path, timeout=self.timeout)
+            # Lets readers go on while another process writes
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT words FROM tags WHERE question = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return MISSING
+        self.hits += 1
+        import json
+        return tuple(tuple(word) for word in json.loads(row[0]))
+
+    def put(self, key, value):
+        if self.maxsize == 0:
+            return
+        import json
+        words = json.dumps([list(word) for word in value])
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO tags (question, words, stored) "
+                "VALUES (?, ?, ?)", (key, words, time.time()))
+
+        self._puts += 1
+        if self._puts % self.prune_every == 0:
+            self.prune()
+
+    def prune(self):
+        """
+        Removes the oldest entries until there are at most `maxsize`.
+        """
+
+        if self.maxsize is None:
+            return
+        with self._connection() as connection:
+            connection.execute(
+                "DELETE FROM tags WHERE question IN ("
+                "SELECT question FROM tags ORDER BY stored DESC, rowid DESC "
+                "LIMIT -1 OFFSET ?)", (self.maxsize,))
+
+    def clear(self):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM tags")
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self))
+
+    def __len__(self):
+        row = self._connection().execute("SELECT COUNT(*) FROM tags").fetchone()
+        return row[0]
+
+    def __contains__(self, key):
+        row = self._connection().execute(
+            "SELECT 1 FROM tags WHERE question = ?", (key,)).fetchone()
+        return row is not None
+
+
+def get_setting(name, config=None):
+    """
+    Returns the value of setting `name` in `config`, a mapping of settings
+    values such as the ones saved by an app when installed, or in
+    `quepy.settings` if `config` is `None`.
+    """
+
+    if config is None:
+        return getattr(settings, name, None)
+    return config.get(name)
+
+
+# Eviction policies available to the `TAG_CACHE` setting, built from the
+# settings values in `config` (see `get_setting`)
+CACHE_POLICIES = {
+    "lru": lambda config: LRUCache(get_setting("TAG_CACHE_SIZE", config)),
+    "ttl": lambda config: TTLCache(get_setting("TAG_CACHE_SIZE", config),
+                                   get_setting("TAG_CACHE_TTL", config)),
+    "sqlite": lambda config: SQLiteCache(
+        get_setting("TAG_CACHE_PATH", config),
+        get_setting("TAG_CACHE_SIZE", config)),
+}
+
+
+def get_tag_cache(config=None):
+    """
+    Return the cache for tagged questions given some app settings,
+    or `None` if tag caching is disabled.
+    `config` is a mapping of settings values, `quepy.settings` is used if
+    it's `None`.
+    """
+
+    policy = get_setting("TAG_CACHE", config)
+    if not policy:
+        return None
+
+    try:
+        factory = CACHE_POLICIES[policy]
+    except KeyError:
+        raise ValueError("Tag cache policy '{}' is not supported".format(policy))
+    return factory(config)
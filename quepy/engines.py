@@ -0,0 +1,656 @@
+# coding: utf-8
+
+# Copyright (c) 2012, Machinalis S.R.L.
+# This file is part of quepy and is distributed under the Modified BSD License.
+# You should have received a copy of license in the LICENSE file.
+#
+# Authors: Rafael Carrascosa <rcarrascosa@machinalis.com>
+#          Gonzalo Garcia Berrotaran <ggarcia@machinalis.com>
+
+from __future__ import absolute_import, unicode_literals
+
+"""
+Matching engines: ways of finding which templates of an app match a
+question.
+
+An engine is built with the templates of an app and its `matches` method
+receives some of those templates, a sequence built with
+`quepy.parsing.eol_terminated`, optionally a `quepy.parsing.MatchBudget` and
+optionally a `quepy.profiling.RuleProfile` where each attempt is recorded.
+It yields `(template, match)` for each template that matches, in the order
+the templates were given, where `match` is a refo match. Templates that go
+over the budget are aborted and recorded in it, once its deadline passes no
+more templates are matched.
+
+The engine is chosen with the `MATCHING_ENGINE` setting.
+"""
+
+import re
+import logging
+from builtins import chr
+
+from refo import Predicate, Any, Disjunction, Concatenation, Star, Plus, \
+    Question, Group, Repetition
+from refo.instructions import Atom, Accept, Split
+from refo.match import Match as RefoMatch
+
+from .analysis import LITERAL_ATTRIBUTES, SET_ATTRIBUTES, length_bounds
+from .parsing import collapse_alternations, BudgetExceeded, Particle
+
+logger = logging.getLogger("quepy.engines")
+
+
+class SequentialEngine(object):
+    """
+    Matches each template on its own, one after the other.
+    Matching is lazy: templates after the ones consumed are not tried.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+
+    def matches(self, rules, sequence, budget=None, profile=None):
+        for rule in rules:
+            try:
+                match = rule.match(sequence, budget, profile)
+            except BudgetExceeded as error:
+                budget.abort(rule, error)
+                if budget.expired():
+                    return
+                continue
+            if match:
+                yield rule, match
+
+
+def _instructions(code):
+    """
+    Returns all the instructions reachable from `code`.
+    """
+
+    seen = set()
+    pending = [code]
+    while pending:
+        instruction = pending.pop()
+        if instruction is None or instruction in seen:
+            continue
+        seen.add(instruction)
+        pending.append(getattr(instruction, "succ", None))
+        pending.append(getattr(instruction, "split", None))
+    return seen
+
+
+def _predicate_key(atom):
+    # Atoms checking the same literal share the key, so they are evaluated
+    # once per word. Others only share it with themselves.
+    function = atom.comparison_function
+    predicate = getattr(function, "__self__", None)
+    attribute = LITERAL_ATTRIBUTES.get(type(predicate))
+    if attribute is not None:
+        return attribute, predicate.tag
+    attribute = SET_ATTRIBUTES.get(type(predicate))
+    if attribute is not None:
+        return attribute, predicate.tags
+    return function
+
+
+class CombinedEngine(object):
+    """
+    Runs the compiled regexes of all the templates together in a single
+    pass over the words.
+
+    Each template keeps its own set of VM threads, with the same priorities
+    refo uses, so the matches are the same as matching one at a time. What
+    is shared is the evaluation of predicates: each distinct literal (e.g.
+    `Lemma("movie")`) is checked once per word no matter how many templates
+    use it, and templates drop out as soon as they can't match.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._keys = {}
+        for rule in self.rules:
+            if rule._code is None:
+                rule.compile()
+            for instruction in _instructions(rule._code):
+                if isinstance(instruction, Atom):
+                    self._keys[instruction] = _predicate_key(instruction)
+
+    def matches(self, rules, sequence, budget=None, profile=None):
+        # One item per template:
+        # [rule, threads, accepting state, steps, seconds]
+        timer = profile.timer if profile is not None else None
+        running = []
+        for rule in rules:
+            start = timer() if timer else 0
+            threads = self._epsilon([(rule._code, {})], 0)
+            state = self._accepting_state(threads, None)
+            seconds = timer() - start if timer else 0
+            running.append([rule, self._cutoff(threads), state, 0, seconds])
+
+        alive = [item for item in running if item[1]]
+        for i, word in enumerate(sequence, 1):
+            if not alive:
+                break
+            results = {}
+            for item in alive:
+                if budget is not None:
+                    item[3] += len(item[1])
+                    try:
+                        budget.check(item[3])
+                    except BudgetExceeded as error:
+                        # A better match could still come, the state found
+                        # so far can't be used
+                        budget.abort(item[0], error)
+                        item[1], item[2] = [], None
+                        continue
+                if timer:
+                    start = timer()
+                threads = self._feed(item[1], word, results)
+                threads = self._epsilon(threads, i)
+                item[2] = self._accepting_state(threads, item[2])
+                item[1] = self._cutoff(threads)
+                if timer:
+                    item[4] += timer() - start
+            alive = [item for item in alive if item[1]]
+
+        if profile is not None:
+            for rule, _, state, _, seconds in running:
+                profile.matched(rule, state, seconds)
+        for rule, _, state, _, _ in running:
+            if state is not None:
+                yield rule, RefoMatch(state)
+
+    def _feed(self, threads, word, results):
+        new = []
+        pcs = set()
+        for pc, state in threads:
+            if isinstance(pc, Accept):
+                continue
+            key = self._keys[pc]
+            try:
+                result = results[key]
+            except KeyError:
+                result = results[key] = pc.comparison_function(word)
+            if result and pc.succ not in pcs:
+                pcs.add(pc.succ)
+                new.append((pc.succ, state))
+        return new
+
+    @staticmethod
+    def _epsilon(threads, i):
+        # Same as refo's `VirtualMachine.do_epsilon_transitions`
+        new = []
+        pcs = set()
+        seen = set()
+        pending = list(reversed(threads))
+        while pending:
+            pc, state = pending.pop()
+            if isinstance(pc, (Atom, Accept)):
+                if pc not in pcs:
+                    pcs.add(pc)
+                    new.append((pc, state))
+                continue
+            if pc in seen:
+                continue
+            seen.add(pc)
+            if isinstance(pc, Split):
+                pending.append((pc.split, dict(state)))
+                pending.append((pc.succ, state))
+            else:  # Is a Save instruction
+                state[pc.record] = i
+                pending.append((pc.succ, state))
+        return new
+
+    @staticmethod
+    def _accepting_state(threads, default):
+        for pc, state in threads:
+            if isinstance(pc, Accept):
+                return state
+        return default
+
+    @staticmethod
+    def _cutoff(threads):
+        for index, (pc, _) in enumerate(threads):
+            if isinstance(pc, Accept):
+                return threads[:index]
+        return threads
+
+
+class Untranslatable(Exception):
+    """
+    The regex uses something that has no equivalent `re` pattern.
+    """
+
+
+# Position of each attribute in the symbol of a word
+_ATTRIBUTE_OFFSETS = {"pos": 0, "lemma": 1, "token": 2}
+_WIDTH = len(_ATTRIBUTE_OFFSETS)
+
+
+def _symbol(number):
+    # Skips the surrogates, they can't be encoded on their own
+    if number >= 0xD800:
+        number += 0x800
+    return chr(number)
+
+
+class RegexEngine(object):
+    """
+    Translates the regexes of the templates to patterns of the standard
+    `re` module, which runs in C.
+
+    Each word is encoded as a fixed width symbol of three characters: the
+    ids of its POS tag, lemma and token. Ids are assigned to the literals
+    used by the templates, values that no template uses get id 0 which
+    never matches a literal. `Pos`, `Lemma` and `Token` compile to the id at
+    their position in the symbol, their set versions to a character class,
+    `Any` to any symbol, and groups map back to word indexes, so `interpret`
+    gets the same match.
+
+    Templates using predicates that can't be translated, or quantifiers of
+    patterns that can themselves match any number of words, are matched
+    with refo. A `re` pattern can't be interrupted, so only the deadline of a
+    budget applies to them and it's checked between templates.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._ids = {attribute: {} for attribute in _ATTRIBUTE_OFFSETS}
+        self._patterns = {}
+        for rule in self.rules:
+            keys = []
+            try:
+                source = self._translate(collapse_alternations(rule.regex),
+                                         keys)
+            except Untranslatable as error:
+                logger.debug("Matching %s with refo: %s",
+                             rule.__class__.__name__, error)
+                continue
+            pattern = re.compile("(?:" + source + r")\Z", re.DOTALL)
+            self._patterns[rule] = pattern, keys
+
+    def _literal(self, attribute, values):
+        ids = self._ids[attribute]
+        symbols = []
+        for value in sorted(values):
+            if value not in ids:
+                ids[value] = len(ids) + 1
+            symbols.append(re.escape(_symbol(ids[value])))
+        if not symbols:
+            raise Untranslatable("empty set of {}s".format(attribute))
+        symbol = ["."] * _WIDTH
+        if len(symbols) == 1:
+            symbol[_ATTRIBUTE_OFFSETS[attribute]] = symbols[0]
+        else:
+            symbol[_ATTRIBUTE_OFFSETS[attribute]] = \
+                "[" + "".join(symbols) + "]"
+        return "".join(symbol)
+
+    def _translate(self, regex, keys):
+        attribute = LITERAL_ATTRIBUTES.get(type(regex))
+        if attribute is not None:
+            return self._literal(attribute, [regex.tag])
+
+        attribute = SET_ATTRIBUTES.get(type(regex))
+        if attribute is not None:
+            return self._literal(attribute, regex.tags)
+
+        if type(regex) is Any:
+            return "." * _WIDTH
+
+        if isinstance(regex, Concatenation):
+            return "".join(self._translate(x, keys) for x in regex.xs)
+
+        if isinstance(regex, Disjunction):
+            return "(?:{}|{})".format(self._translate(regex.a, keys),
+                                      self._translate(regex.b, keys))
+
+        if isinstance(regex, Group):
+            # Groups are numbered by their opening parenthesis
+            keys.append(regex.key)
+            return "({})".format(self._translate(regex.x, keys))
+
+        if isinstance(regex, (Star, Plus, Repetition)) and \
+                length_bounds(regex.x)[1] is None:
+            # `re` backtracks exponentially on nested unbounded quantifiers,
+            # like `(?:(?:X)?(?:Y)+)+`, and can't be interrupted. refo
+            # matches them in polynomial time.
+            raise Untranslatable("nested unbounded quantifier in "
+                                 "{!r}".format(regex))
+
+        if isinstance(regex, (Star, Plus, Question)):
+            operator = {Star: "*", Plus: "+", Question: "?"}[type(regex)]
+            if not regex.greedy:
+                operator += "?"
+            return "(?:{}){}".format(self._translate(regex.x, keys), operator)
+
+        if isinstance(regex, Repetition):
+            operator = "{{{},{}}}".format(
+                regex.mn, "" if regex.mx is None else regex.mx)
+            if not regex.greedy:
+                operator += "?"
+            return "(?:{}){}".format(self._translate(regex.x, keys), operator)
+
+        raise Untranslatable("can't translate {!r}".format(regex))
+
+    def encode(self, words):
+        """
+        Returns the string of symbols matched by the patterns for `words`.
+        """
+
+        pos_ids = self._ids["pos"]
+        lemma_ids = self._ids["lemma"]
+        token_ids = self._ids["token"]
+        return "".join(_symbol(pos_ids.get(word.pos, 0)) +
+                       _symbol(lemma_ids.get(word.lemma, 0)) +
+                       _symbol(token_ids.get(word.token, 0))
+                       for word in words)
+
+    def matches(self, rules, sequence, budget=None, profile=None):
+        # The sequence ends with the end of line mark, the patterns are
+        # anchored to the end of the string instead
+        words = sequence[:-1]
+        encoded = None
+        for rule in rules:
+            if budget is not None and budget.expired():
+                budget.abort(rule, BudgetExceeded("deadline passed"))
+                return
+
+            try:
+                pattern, keys = self._patterns[rule]
+            except KeyError:
+                try:
+                    match = rule.match(sequence, budget, profile)
+                except BudgetExceeded as error:
+                    budget.abort(rule, error)
+                    continue
+                if match:
+                    yield rule, match
+                continue
+
+            if encoded is None:
+                encoded = self.encode(words)
+            if profile is None:
+                match = pattern.match(encoded)
+            else:
+                start = profile.timer()
+                match = pattern.match(encoded)
+                profile.matched(rule, match, profile.timer() - start)
+            if match:
+                yield rule, self._to_refo(match, keys)
+
+    @staticmethod
+    def _to_refo(match, keys):
+        # As in refo, the whole match includes the end of line mark
+        state = {(None, 0): 0, (None, 1): match.end() // _WIDTH + 1}
+        for number, key in enumerate(keys, 1):
+            i, j = match.span(number)
+            if i != -1:
+                state[(key, 0)] = i // _WIDTH
+                state[(key, 1)] = j // _WIDTH
+        return RefoMatch(state)
+
+
+class _Question(object):
+    """
+    What `MemoEngine` keeps while matching a question.
+    """
+
+    def __init__(self, words, budget):
+        self.words = words
+        self.budget = budget
+        self.steps = 0
+        # Ends and groups of each sub-pattern by start, see `_memoized`
+        self.memo = {}
+
+
+def _first_ends(items):
+    """
+    Returns `items`, `(end, groups)` pairs in priority order, keeping only
+    the first pair of each end.
+    """
+
+    result = []
+    seen = set()
+    for end, groups in items:
+        if end not in seen:
+            seen.add(end)
+            result.append((end, groups))
+    return result
+
+
+def _merged(groups, other):
+    if not other:
+        return groups
+    if not groups:
+        return other
+    result = dict(groups)
+    result.update(other)
+    return result
+
+
+def _memoized(matcher, key=None):
+    # The possible ends of a sub-pattern only depend on where it starts, and
+    # for each end only the first way of reaching it counts, it's the one
+    # with the highest priority. So they are found once per question and
+    # start, which keeps matching polynomial. Particles use their regex as
+    # key, so they are shared by all the templates that use them.
+    if key is None:
+        key = object()
+
+    def match(question, i):
+        try:
+            return question.memo[key, i]
+        except KeyError:
+            ends = question.memo[key, i] = matcher(question, i)
+            return ends
+    return match
+
+
+def _empty(question, i):
+    return [(i, {})]
+
+
+def _predicate(regex):
+    function = regex.f
+
+    def match(question, i):
+        if question.budget is not None:
+            question.steps += 1
+            question.budget.check(question.steps)
+        if i < len(question.words) and function(question.words[i]):
+            return [(i + 1, {})]
+        return []
+    return match
+
+
+def _concatenation(matchers):
+    first = matchers[0]
+    if len(matchers) == 1:
+        return first
+    rest = _concatenation(matchers[1:])
+
+    def match(question, i):
+        return _first_ends((k, _merged(groups_j, groups_k))
+                           for j, groups_j in first(question, i)
+                           for k, groups_k in rest(question, j))
+    return _memoized(match)
+
+
+def _disjunction(a, b):
+    def match(question, i):
+        return _first_ends(a(question, i) + b(question, i))
+    return _memoized(match)
+
+
+def _star(x, greedy):
+    # The ends from a start are those of the iterations from the ends of the
+    # first one, which are further on, so they are found from the last word
+    # back to the start instead of recursing once per word. Iterations that
+    # don't consume words are dropped, as refo drops threads in an epsilon
+    # cycle.
+    def match(question, i):
+        memo = question.memo
+        for start in range(len(question.words), i - 1, -1):
+            if (key, start) in memo:
+                continue
+            more = [(k, _merged(groups_j, groups_k))
+                    for j, groups_j in x(question, start) if j != start
+                    for k, groups_k in memo[key, j]]
+            if greedy:
+                ends = more + [(start, {})]
+            else:
+                ends = [(start, {})] + more
+            memo[key, start] = _first_ends(ends)
+        return memo[key, i]
+
+    key = object()
+    return match
+
+
+def _question(x, greedy):
+    def match(question, i):
+        if greedy:
+            return _first_ends(x(question, i) + [(i, {})])
+        return _first_ends([(i, {})] + x(question, i))
+    return _memoized(match)
+
+
+def _group(x, key):
+    def match(question, i):
+        result = []
+        for j, groups in x(question, i):
+            groups = dict(groups)
+            groups[(key, 0)] = i
+            groups[(key, 1)] = j
+            result.append((j, groups))
+        return result
+    return match
+
+
+def _build_matcher(regex):
+    """
+    Returns a function that gives the `(end, groups)` of `regex` from a
+    start, one per end, in the order of refo's priorities.
+    """
+
+    if isinstance(regex, Predicate):
+        return _predicate(regex)
+
+    if isinstance(regex, Concatenation):
+        return _concatenation([_build_matcher(x) for x in regex.xs])
+
+    if isinstance(regex, Disjunction):
+        return _disjunction(_build_matcher(regex.a), _build_matcher(regex.b))
+
+    if isinstance(regex, Group):
+        x = _build_matcher(regex.x)
+        if isinstance(regex.key, Particle):
+            x = _memoized(x, regex.key.regex)
+        return _group(x, regex.key)
+
+    if isinstance(regex, Star):
+        return _star(_build_matcher(regex.x), regex.greedy)
+
+    if isinstance(regex, Plus):
+        x = _build_matcher(regex.x)
+        return _concatenation([x, _star(x, regex.greedy)])
+
+    if isinstance(regex, Question):
+        return _question(_build_matcher(regex.x), regex.greedy)
+
+    if isinstance(regex, Repetition):
+        x = _build_matcher(regex.x)
+        if regex.mx is None:
+            rest = [_star(x, regex.greedy)]
+        else:
+            rest = [_question(x, regex.greedy)] * (regex.mx - regex.mn)
+        matchers = [x] * regex.mn + rest
+        if not matchers:
+            return _empty
+        return _concatenation(matchers)
+
+    raise Untranslatable("can't match {!r}".format(regex))
+
+
+class MemoEngine(object):
+    """
+    Matches in the same priority order refo uses, keeping a per question
+    memo of the ends (and groups) of every sub-pattern by start.
+
+    For each end only the highest priority way of reaching it is kept, so
+    every sub-pattern is matched at most once per word and matching stays
+    polynomial, even on ambiguous regexes such as nested stars. The ends of
+    a particle regex are also reused by every template that embeds a
+    particle with that regex, e.g. all the particles of the dbpedia movies
+    module built on `nouns`. The memo lives while the question is matched.
+
+    A `MatchBudget` counts each predicate check as a step. Templates using
+    patterns refo doesn't define are matched with refo.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._matchers = {}
+        for rule in self.rules:
+            try:
+                matcher = _build_matcher(collapse_alternations(rule.regex))
+            except Untranslatable as error:
+                logger.debug("Matching %s with refo: %s",
+                             rule.__class__.__name__, error)
+                continue
+            self._matchers[rule] = matcher
+
+    def matches(self, rules, sequence, budget=None, profile=None):
+        question = _Question(sequence[:-1], budget)
+        for rule in rules:
+            matcher = self._matchers.get(rule)
+            try:
+                if matcher is None:
+                    match = rule.match(sequence, budget, profile)
+                elif profile is None:
+                    match = self._match(matcher, question)
+                else:
+                    match = None
+                    start = profile.timer()
+                    try:
+                        match = self._match(matcher, question)
+                    finally:
+                        profile.matched(rule, match, profile.timer() - start)
+            except BudgetExceeded as error:
+                budget.abort(rule, error)
+                if budget.expired():
+                    return
+                continue
+            if match:
+                yield rule, match
+
+    @staticmethod
+    def _match(matcher, question):
+        question.steps = 0
+        length = len(question.words)
+        for end, groups in matcher(question, 0):
+            if end == length:
+                # As in refo, the whole match includes the end of line mark
+                state = dict(groups)
+                state[(None, 0)] = 0
+                state[(None, 1)] = length + 1
+                return RefoMatch(state)
+        return None
+
+
+# Engines available to the `MATCHING_ENGINE` setting
+ENGINES = {
+    "sequential": SequentialEngine,
+    "combined": CombinedEngine,
+    "regex": RegexEngine,
+    "memo": MemoEngine,
+}
+
+
+def get_engine(rules, name):
+    try:
+        engine = ENGINES[name]
+    except KeyError:
+        raise ValueError("Matching engine '{}' is not supported".format(name))
+    return engine(rules)
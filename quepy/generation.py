@@ -16,11 +16,9 @@ The currently supported languages are:
     * MQL
     * Sparql
     * Dot: generation of graph images mainly for debugging.
-"""
 
-from .mql_generation import generate_mql
-from .dot_generation import expression_to_dot
-from .sparql_generation import expression_to_sparql
+Each generator module is imported the first time its language is used.
+"""
 
 
 def get_code(expression, language):
@@ -30,10 +28,13 @@ def get_code(expression, language):
     """
 
     if language == "sparql":
+        from .sparql_generation import expression_to_sparql
         return expression_to_sparql(expression)
     elif language == "dot":
+        from .dot_generation import expression_to_dot
         return expression_to_dot(expression)
     elif language == "mql":
+        from .mql_generation import generate_mql
         return generate_mql(expression)
     else:
         raise ValueError("Language '{}' is not supported".format(language))
@@ -19,11 +19,13 @@ Tagging using NLTK.
 
 from builtins import str
 from future.utils import iteritems
+from itertools import islice
 
 import nltk
 from nltk.corpus import wordnet
 
-from .tagger import Word
+from .cache import LRUCache, MISSING
+from .tagger import TaggedSentence, PENN_TAGSET, DEFAULT_CHUNKSIZE
 
 
 class run_nltktagger(object):
@@ -35,11 +37,17 @@ class run_nltktagger(object):
 		'RB': wordnet.ADV,
 	}
 
-	def __init__(self, nltk_data_path=None):
+	def __init__(self, nltk_data_path=None, lemma_cache_size=10000):
 		if nltk_data_path:
 			nltk.data.path = nltk_data_path
 
-	def penn_to_morphy_tag(self, tag):
+		# Lookup table for every known tag, others fall back to prefix search
+		self._morphy_tags = {tag: self._find_morphy_tag(tag) for tag in PENN_TAGSET}
+		# Lemmas keyed by (token, morphy tag), the default size is the same as
+		# the LEMMA_CACHE_SIZE setting and `None` means unbounded
+		self.lemma_cache = LRUCache(lemma_cache_size)
+
+	def _find_morphy_tag(self, tag):
 		# type: (str, ) -> Optional[str]
 
 		for penn, morphy in iteritems(self._penn_to_morphy_tag):
@@ -47,34 +55,90 @@ class run_nltktagger(object):
 				return morphy
 		return None
 
-	def __call__(self, string):
-		# type: (str) -> List[str]
+	def penn_to_morphy_tag(self, tag):
+		# type: (str, ) -> Optional[str]
+
+		try:
+			return self._morphy_tags[tag]
+		except KeyError:
+			return self._find_morphy_tag(tag)
+
+	def lemmatize(self, token, mtag):
+		# type: (str, Optional[str]) -> Optional[str]
 
 		"""
-		Runs nltk tagger on `string` and returns a list of
-		:class:`quepy.tagger.Word` objects.
+		Returns the wordnet lemma of `token` or `None` if there is no such
+		lemma. Results are memoized in `lemma_cache`.
 		"""
 
+		key = (token, mtag)
+		lemma = self.lemma_cache.get(key)
+		if lemma is MISSING:
+			lemma = wordnet.morphy(token, pos=mtag)
+			self.lemma_cache.put(key, lemma)
+		return lemma
+
+	def _tokenize(self, string):
+		# type: (str, ) -> List[str]
+
 		if not isinstance(string, str):
 			raise TypeError("Input must be a unicode string")
 
 		# Recommended tokenizer doesn't handle non-ascii characters very well
 		#tokens = nltk.word_tokenize(string)
-		tokens = nltk.wordpunct_tokenize(string)
-		tags = nltk.pos_tag(tokens)
+		return nltk.wordpunct_tokenize(string)
+
+	def _to_words(self, tags):
+		# type: (List[Tuple[str, str]], ) -> TaggedSentence
 
-		words = []
+		tokens = []
+		lemmas = []
+		pos_tags = []
 		for token, pos in tags:
-			word = Word(token)
 			# Eliminates stuff like JJ|CC
-			word.pos = pos.split("|")[0]
+			pos = pos.split("|")[0]
 
-			mtag = self.penn_to_morphy_tag(word.pos)
+			mtag = self.penn_to_morphy_tag(pos)
 			# Nice shooting, son. What's your name?
-			word.lemma = wordnet.morphy(word.token, pos=mtag)
-			if not word.lemma:
-				word.lemma = word.token.lower()
+			lemma = self.lemmatize(token, mtag)
+			if not lemma:
+				lemma = token.lower()
+
+			tokens.append(token)
+			lemmas.append(lemma)
+			pos_tags.append(pos)
 
-			words.append(word)
+		return TaggedSentence(tokens, lemmas, pos_tags)
+
+	def __call__(self, string):
+		# type: (str) -> TaggedSentence
+
+		"""
+		Runs nltk tagger on `string` and returns its
+		:class:`quepy.tagger.TaggedSentence`.
+		"""
+
+		tokens = self._tokenize(string)
+		tags = nltk.pos_tag(tokens)
+		return self._to_words(tags)
+
+	def tag_many(self, strings, chunksize=None):
+		# type: (Iterable[str], Optional[int]) -> Iterator[TaggedSentence]
+
+		"""
+		Runs nltk tagger on every string of `strings` and yields a
+		:class:`quepy.tagger.TaggedSentence` for each one, in input order.
+
+		Input is consumed lazily and tagged `chunksize` strings at a time
+		with `nltk.pos_tag_sents`, so the tagger is set up once per chunk
+		instead of once per string.
+		"""
 
-		return words
+		chunksize = chunksize or DEFAULT_CHUNKSIZE
+		strings = iter(strings)
+		while True:
+			chunk = [self._tokenize(string) for string in islice(strings, chunksize)]
+			if not chunk:
+				break
+			for tags in nltk.pos_tag_sents(chunk):
+				yield self._to_words(tags)
@@ -10,9 +10,17 @@
 from __future__ import absolute_import, unicode_literals
 from future.utils import python_2_unicode_compatible
 
-import refo
+import time
 import logging
-from refo import Predicate, Literal, Star, Any, Group
+from refo import Predicate, Literal, Star, Plus, Question, Any, Group, \
+    Disjunction, Concatenation, Repetition
+from refo.match import Match as RefoMatch
+from refo.virtualmachine import VirtualMachine
+
+try:
+    from sys import intern
+except ImportError:
+    from quepy.tagger import intern
 
 _EOL = None
 logger = logging.getLogger("quepy.parsing")
@@ -24,6 +32,103 @@ class BadSemantic(Exception):
     """
 
 
+class BudgetExceeded(Exception):
+    """
+    The matching of a regex went over its `MatchBudget`.
+    """
+
+
+class MatchBudget(object):
+    """
+    Limits the work spent matching a question: each template can take at
+    most `steps` VM steps (a thread consuming a word) and no template is
+    matched after `timeout` seconds from the creation of the budget.
+    `None` means no limit.
+    The templates that went over the budget are kept in `aborted` as
+    `(template, reason)` and `timed_out` tells if the deadline was found
+    passed.
+    """
+
+    def __init__(self, steps=None, timeout=None, timer=time.time):
+        self.steps = steps
+        self.timer = timer
+        self.deadline = None if timeout is None else timer() + timeout
+        self.aborted = []
+        self.timed_out = False
+
+    def expired(self):
+        if self.deadline is not None and self.timer() > self.deadline:
+            self.timed_out = True
+        return self.timed_out
+
+    def check(self, steps):
+        """
+        Raises `BudgetExceeded` if `steps` is over the limit or the deadline
+        has passed.
+        """
+
+        if self.steps is not None and steps > self.steps:
+            raise BudgetExceeded("over {} steps".format(self.steps))
+        if self.expired():
+            raise BudgetExceeded("deadline passed")
+
+    def abort(self, rule, error):
+        logger.warning("Matching of %s aborted: %s",
+                       rule.__class__.__name__, error)
+        self.aborted.append((rule, error))
+
+
+def eol_terminated(words):
+    """
+    Returns `words` followed by the end of line mark, which is what compiled
+    regexes are matched against.
+    """
+
+    return list(words) + [_EOL]
+
+
+def compile_regex(regex, collapse=True):
+    """
+    Compiles `regex` to refo VM code that only matches whole sequences,
+    i.e. sequences built with `eol_terminated`.
+    If `collapse` is true alternations are collapsed first (see
+    `collapse_alternations`).
+    """
+
+    if collapse:
+        regex = collapse_alternations(regex)
+    return Group(regex + Literal(_EOL), None).compile()
+
+
+def run_compiled(code, sequence, budget=None):
+    """
+    Runs compiled regex `code` over `sequence`, as `refo.match` does
+    without compiling the pattern again.
+    Returns a refo match or `None`, raises `BudgetExceeded` if `budget` (a
+    `MatchBudget`) is exceeded.
+    """
+
+    vm = VirtualMachine(code)
+    match = RefoMatch()
+    vm.do_epsilon_transitions()
+    match.state = vm.accepting_state(None)
+    vm.cutoff()
+    steps = 0
+    for word in sequence:
+        if not vm.is_alive():
+            break
+        if budget is not None:
+            steps += len(vm.threads)
+            budget.check(steps)
+        vm.feed(word)
+        vm.do_epsilon_transitions()
+        match.state = vm.accepting_state(match.state)
+        vm.cutoff()
+    if match.state is None:
+        return None
+    return match
+
+
 class WordList(list):
     """
     A list of words with some utils for the user.
@@ -43,9 +148,87 @@ class WordList(list):
         return " ".join(x.lemma for x in self)
 
 
+class WordSpan(object):
+    """
+    A read-only view of the words `start` to `stop` of a question, that
+    doesn't copy them. Supports `len`, iteration and indexing (slices give
+    another view) and has the `tokens` and `lemmas` of `WordList`.
+    `to_list` returns a copy as a `WordList`.
+    Like a slice, the bounds are clipped to the words.
+    """
+
+    __slots__ = ("_words", "_start", "_stop", "_tokens", "_lemmas")
+
+    def __init__(self, words, start=0, stop=None):
+        length = len(words)
+        if stop is None or stop > length:
+            stop = length
+        self._words = words
+        self._start = min(start, stop)
+        self._stop = stop
+        self._tokens = None
+        self._lemmas = None
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __iter__(self):
+        words = self._words
+        for i in range(self._start, self._stop):
+            yield words[i]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return self.to_list()[index]
+            return WordSpan(self._words, self._start + start,
+                            self._start + max(start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("word index out of range")
+        return self._words[self._start + index]
+
+    def __eq__(self, other):
+        if isinstance(other, (WordSpan, list, tuple)):
+            return len(self) == len(other) and list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "WordSpan({!r})".format(self.to_list())
+
+    @property
+    def tokens(self):
+        if self._tokens is None:
+            self._tokens = " ".join(x.token for x in self)
+        return self._tokens
+
+    @property
+    def lemmas(self):
+        if self._lemmas is None:
+            self._lemmas = " ".join(x.lemma for x in self)
+        return self._lemmas
+
+    def to_list(self):
+        return WordList(self)
+
+
 class Match(object):
     """
     Holds the matching of the regex.
+
+    Words are given as `WordSpan` views of the question. They and the
+    particle interpretations are computed on first access and kept for the
+    life of the match, so accessing them again returns the same objects.
     """
 
     def __init__(self, match, words, i=None, j=None):
@@ -56,13 +239,16 @@ class Match(object):
         self._j = j
         self._particles = {particle.name: particle for particle in match
                            if isinstance(particle, Particle)}
+        self._words_view = None
 
     @property
     def words(self):
-        i, j = self._match.span()  # Should be (0, n)
-        if self._i is not None:
-            i, j = self._i, self._j
-        return WordList(self._words[i:j])
+        if self._words_view is None:
+            i, j = self._match.span()  # Should be (0, n)
+            if self._i is not None:
+                i, j = self._i, self._j
+            self._words_view = WordSpan(self._words, i, j)
+        return self._words_view
 
     def __getattr__(self, attr):
         if attr in self._particles:
@@ -70,15 +256,20 @@ class Match(object):
             i, j = self._match[particle]
             self._check_valid_indexes(i, j, attr)
             match = Match(self._match, self._words, i, j)
-            return particle.interpret(match)
+            value = particle.interpret(match)
+        else:
+            try:
+                i, j = self._match[attr]
+            except KeyError:
+                message = "'{}' object has no attribute '{}'"
+                raise AttributeError(message.format(self.__class__.__name__,
+                                                    attr))
+            self._check_valid_indexes(i, j, attr)
+            value = WordSpan(self._words, i, j)
 
-        try:
-            i, j = self._match[attr]
-        except KeyError:
-            message = "'{}' object has no attribute '{}'"
-            raise AttributeError(message.format(self.__class__.__name__, attr))
-        self._check_valid_indexes(i, j, attr)
-        return WordList(self._words[i:j])
+        # Stored as an attribute, `__getattr__` isn't called again for it
+        self.__dict__[attr] = value
+        return value
 
     def _check_valid_indexes(self, i, j, attr):
         if self._i is None:
@@ -95,6 +286,7 @@ class QuestionTemplate(object):
 
     regex = Star(Any())  # Must define when subclassing
     weight = 1  # Redefine this to give different priorities to your regexes.
+    _code = None  # `regex` compiled by `compile`
 
     def interpret(self, match):
         """
@@ -106,28 +298,90 @@ class QuestionTemplate(object):
         """
         raise NotImplementedError()
 
-    def get_interpretation(self, words):
+    def compile(self):
+        """
+        Compiles the regex of the template. It's done once, when the app is
+        installed or on the first match.
+        """
+
+        self._code = compile_regex(self.regex)
+        return self._code
+
+    def match(self, sequence, budget=None, profile=None):
+        """
+        Matches the regex against `sequence`, the tagged words followed by
+        the end of line mark (see `eol_terminated`).
+        Returns a refo match or `None`, raises `BudgetExceeded` if `budget`
+        is exceeded. The attempt is recorded in `profile`, a
+        `quepy.profiling.RuleProfile`, if given.
+        """
+
+        code = self._code
+        if code is None:
+            code = self.compile()
+        if profile is None:
+            return run_compiled(code, sequence, budget)
+
+        match = None
+        start = profile.timer()
+        try:
+            match = run_compiled(code, sequence, budget)
+        finally:
+            profile.matched(self, match, profile.timer() - start)
+        return match
+
+    def get_interpretation(self, words, sequence=None, budget=None,
+                           profile=None):
+        """
+        Matches the regex against `words` and interprets the match.
+        `sequence` is `eol_terminated(words)`, it can be given to share it
+        between templates.
+        If `budget` (a `MatchBudget`) is exceeded the matching is aborted
+        and there's no interpretation. Timings are recorded in `profile`, a
+        `quepy.profiling.RuleProfile`, if given.
+        """
+
         rulename = self.__class__.__name__
         logger.debug("Trying to match with regex: %s", rulename)
 
-        match = refo.match(self.regex + Literal(_EOL), words + [_EOL])
+        if sequence is None:
+            sequence = eol_terminated(words)
+        try:
+            match = self.match(sequence, budget, profile)
+        except BudgetExceeded as error:
+            budget.abort(self, error)
+            return None, None
+        return self.interpret_match(match, words, profile)
+
+    def interpret_match(self, match, words, profile=None):
+        """
+        Interprets `match`, a refo match of the regex over `words` or `None`.
+        Returns the expression and the user data, or `None, None` if there
+        is no match or the interpretation raised `BadSemantic`.
+        """
 
         if not match:
             logger.debug("No match")
             return None, None
 
+        if profile is not None:
+            start = profile.timer()
         try:
             match = Match(match, words)
             result = self.interpret(match)
         except BadSemantic as error:
             logger.debug(str(error))
+            if profile is not None:
+                profile.interpreted(self, True, profile.timer() - start)
             return None, None
+        if profile is not None:
+            profile.interpreted(self, False, profile.timer() - start)
         try:
             expression, userdata = result
         except TypeError:
             expression, userdata = result, None
 
-        expression.rule_used = rulename
+        expression.rule_used = self.__class__.__name__
         return expression, userdata
 
 
@@ -137,7 +391,9 @@ class Pos(Predicate):
     """
 
     def __init__(self, tag):
-        self.tag = tag
+        # Interned like the words of a `TaggedSentence`, so that comparing
+        # against them takes the fast path of `==` for the same object
+        self.tag = intern(tag)
         super(Pos, self).__init__(self._predicate)
         self.arg = tag
 
@@ -166,6 +422,41 @@ class Token(Pos):
         return word.token == self.tag
 
 
+class PosIn(Predicate):
+    """
+    Predicate to check if the *POS* tag of a word is one of `tags`.
+    """
+
+    def __init__(self, tags):
+        self.tags = frozenset(intern(tag) for tag in tags)
+        super(PosIn, self).__init__(self._predicate)
+        self.arg = sorted(self.tags)
+
+    def _predicate(self, word):
+        return word != _EOL and self._check(word)
+
+    def _check(self, word):
+        return word.pos in self.tags
+
+
+class LemmaIn(PosIn):
+    """
+    Predicate to check if the *lemma* of a word is one of `tags`.
+    """
+
+    def _check(self, word):
+        return word.lemma in self.tags
+
+
+class TokenIn(PosIn):
+    """
+    Predicate to check if the *token* of a word is one of `tags`.
+    """
+
+    def _check(self, word):
+        return word.token in self.tags
+
+
 @python_2_unicode_compatible
 class Particle(Group):
     regex = None
@@ -230,3 +521,90 @@ def Poss(string):
     with the POS mentioned on `string`.
     """
     return _predicate_sum_from_string(string, Pos)
+
+
+def LemmasIn(string):
+    """
+    Returns a Predicate that catches a word
+    with any of the lemmas mentioned on `string`.
+    """
+    return LemmaIn(string.split())
+
+
+def TokensIn(string):
+    """
+    Returns a Predicate that catches a word
+    with any of the tokens mentioned on `string`.
+    """
+    return TokenIn(string.split())
+
+
+def PossIn(string):
+    """
+    Returns a Predicate that catches a word
+    with any of the POS mentioned on `string`.
+    """
+    return PosIn(string.split())
+
+
+# Set predicate that each predicate can be merged into. Subclasses are not
+# included because they may redefine what is checked.
+_SET_PREDICATES = {Pos: PosIn, Lemma: LemmaIn, Token: TokenIn,
+                   PosIn: PosIn, LemmaIn: LemmaIn, TokenIn: TokenIn}
+
+
+def _as_set(regex):
+    predicate = _SET_PREDICATES.get(type(regex))
+    if predicate is None:
+        return None, None
+    if isinstance(regex, PosIn):
+        return predicate, regex.tags
+    return predicate, frozenset([regex.tag])
+
+
+def collapse_alternations(regex):
+    """
+    Returns `regex` with the alternations of predicates on the same
+    attribute merged into a single set predicate,
+    e.g. `Pos("NN") | Pos("NNS")` becomes `PosIn(["NN", "NNS"])`.
+    The result matches the same, with one check per word instead of one per
+    alternative. `regex` is not modified.
+    """
+
+    if isinstance(regex, Disjunction):
+        a = collapse_alternations(regex.a)
+        b = collapse_alternations(regex.b)
+        apredicate, atags = _as_set(a)
+        bpredicate, btags = _as_set(b)
+        if apredicate is not None and apredicate is bpredicate:
+            return apredicate(atags | btags)
+        if a is regex.a and b is regex.b:
+            return regex
+        return Disjunction(a, b)
+
+    if isinstance(regex, Concatenation):
+        xs = [collapse_alternations(x) for x in regex.xs]
+        if all(x is y for x, y in zip(xs, regex.xs)):
+            return regex
+        return Concatenation(*xs)
+
+    if isinstance(regex, Group):
+        x = collapse_alternations(regex.x)
+        if x is regex.x:
+            return regex
+        # Keeps the key, matches are still reported under the particle
+        return Group(x, regex.key)
+
+    if isinstance(regex, (Star, Plus, Question)):
+        x = collapse_alternations(regex.x)
+        if x is regex.x:
+            return regex
+        return type(regex)(x, greedy=regex.greedy)
+
+    if isinstance(regex, Repetition):
+        x = collapse_alternations(regex.x)
+        if x is regex.x:
+            return regex
+        return Repetition(x, regex.mn, regex.mx, regex.greedy)
+
+    return regex
@@ -0,0 +1,110 @@
+# coding: utf-8
+
+# Copyright (c) 2012, Machinalis S.R.L.
+# This file is part of quepy and is distributed under the Modified BSD License.
+# You should have received a copy of license in the LICENSE file.
+#
+# Authors: Rafael Carrascosa <rcarrascosa@machinalis.com>
+#          Gonzalo Garcia Berrotaran <ggarcia@machinalis.com>
+
+from __future__ import absolute_import, unicode_literals
+
+"""
+Per template profiling counters, to find the templates that are expensive
+to match or interpret.
+"""
+
+import sys
+import time
+
+_timer = getattr(time, "perf_counter", time.time)
+
+
+def _new_counters():
+    return {"attempts": 0, "matches": 0, "rejected": 0,
+            "match_time": 0.0, "interpret_time": 0.0}
+
+
+class RuleProfile(object):
+    """
+    Counts, for each template (by class name), how many times it was
+    matched against a question, how many times it matched, how many of the
+    matches were rejected by `interpret` raising `BadSemantic`, and the
+    seconds spent matching and interpreting.
+    """
+
+    def __init__(self, timer=_timer):
+        self.timer = timer
+        self.reset()
+
+    def reset(self):
+        self._counters = {}
+
+    def _get(self, rule):
+        name = rule.__class__.__name__
+        try:
+            return self._counters[name]
+        except KeyError:
+            counters = self._counters[name] = _new_counters()
+            return counters
+
+    def matched(self, rule, match, seconds):
+        """
+        Records an attempt to match `rule` that took `seconds` and gave
+        `match`.
+        """
+
+        counters = self._get(rule)
+        counters["attempts"] += 1
+        if match:
+            counters["matches"] += 1
+        counters["match_time"] += seconds
+
+    def interpreted(self, rule, rejected, seconds):
+        """
+        Records an interpretation of a match of `rule` that took `seconds`.
+        `rejected` tells if it raised `BadSemantic`.
+        """
+
+        counters = self._get(rule)
+        if rejected:
+            counters["rejected"] += 1
+        counters["interpret_time"] += seconds
+
+    def stats(self):
+        """
+        Returns the counters of each template, by class name.
+        """
+
+        return {name: dict(counters)
+                for name, counters in self._counters.items()}
+
+    def by_cost(self):
+        """
+        Returns `(name, counters)` for each template, the most expensive
+        (matching plus interpreting time) first.
+        """
+
+        def cost(item):
+            counters = item[1]
+            return counters["match_time"] + counters["interpret_time"]
+
+        return sorted(self.stats().items(), key=cost, reverse=True)
+
+    def dump(self, stream=None):
+        """
+        Writes a table of the counters to `stream` (defaults to stdout),
+        the most expensive templates first.
+        """
+
+        if stream is None:
+            stream = sys.stdout
+        line = "{:<30} {:>9} {:>9} {:>9} {:>12} {:>12}\n"
+        stream.write(line.format("template", "attempts", "matches",
+                                 "rejected", "match ms", "interpret ms"))
+        for name, counters in self.by_cost():
+            stream.write(line.format(
+                name, counters["attempts"], counters["matches"],
+                counters["rejected"],
+                "{:.3f}".format(counters["match_time"] * 1000),
+                "{:.3f}".format(counters["interpret_time"] * 1000)))
@@ -13,16 +13,15 @@ from __future__ import absolute_import, unicode_literals
 Implements the Quepy Application API
 """
 
-from future.utils import iteritems
-
 import logging
+from collections import Counter, deque, namedtuple
+from functools import partial
 from importlib import import_module
+from itertools import count, groupby, islice
 from operator import attrgetter
 from types import ModuleType
 
 from . import settings, generation
-from .parsing import QuestionTemplate
-from .tagger import get_tagger, TaggingError
 
 logger = logging.getLogger("quepy.quepyapp")
 
@@ -38,7 +37,7 @@ def install(app_name):
     }
     modules = {}
 
-    for module_name, module_path in iteritems(module_paths):
+    for module_name, module_path in module_paths.items():
         try:
             modules[module_name] = import_module(module_path.format(app_name))
         except ImportError as error:
@@ -48,6 +47,12 @@ def install(app_name):
     return QuepyApp(**modules)
 
 
+# Result of a question translated by `QuepyApp.get_queries_batch`. `queries`
+# is the list of `(target, query, userdata)` or `None` if `error`, the
+# exception raised by the question, is set.
+BatchResult = namedtuple("BatchResult", "question queries error")
+
+
 def question_sanitize(question):
     question = question.replace("'", "\'")
     question = question.replace("\"", "\\\"")
@@ -64,6 +69,8 @@ class QuepyApp(object):
         Creates the application based on `parsing`, `settings` modules.
         """
 
+        from .parsing import QuestionTemplate
+
         assert isinstance(parsing, ModuleType)
         assert isinstance(settings, ModuleType)
 
@@ -72,8 +79,11 @@ class QuepyApp(object):
 
         # Save the settings right after loading settings module
         self._save_settings_values()
+        # The tagger is built on first use, from the settings of this app
+        # and not those of apps installed later
+        self._tagger_config = _settings_values()
 
-        self.tagger = get_tagger()
+        self._tagger = None
         self.language = getattr(self._settings_module, "LANGUAGE", None)
         if not self.language:
             raise ValueError("Missing configuration for language")
@@ -91,6 +101,92 @@ class QuepyApp(object):
                 continue
 
         self.rules.sort(key=attrgetter("weight"), reverse=True)
+        self._setup_matching()
+
+    @property
+    def tagger(self):
+        """
+        The tagger used by the app. It's built on first use, so installing
+        an app doesn't load the tagging libraries and models.
+        """
+
+        if self._tagger is None:
+            from .cache import get_tag_cache
+            from .tagger import get_tagger, CachedTagger, \
+                tag_cache_namespace
+
+            config = self._tagger_config
+            tagger = get_tagger(config=config)
+            tag_cache = get_tag_cache(config)
+            if tag_cache is not None:
+                tagger = CachedTagger(tagger, tag_cache,
+                                      tag_cache_namespace(config))
+            self._tagger = tagger
+        return self._tagger
+
+    @tagger.setter
+    def tagger(self, tagger):
+        self._tagger = tagger
+
+    def warmup(self):
+        """
+        Loads the tagger models and data, which are otherwise loaded by the
+        first question. Call it before taking traffic.
+        """
+
+        self.tagger.warmup()
+
+    def stats(self):
+        """
+        Returns debugging statistics of the app:
+
+        - "prefilter": how many template matchings were avoided by the
+          static analysis of the templates (see `quepy.analysis.RuleIndex`).
+        - "dispatch": how many templates are in the bucket of each first
+          word literal and in the fallback bucket, to spot imbalanced
+          templates (see `quepy.analysis.FirstWordIndex`).
+        - "budget": how many times the matching of each template was
+          aborted for going over the budget, and how many questions ran out
+          of time (see the `MATCH_STEP_BUDGET` and `MATCH_TIMEOUT` settings).
+        - "rules": the counters of each template if the `PROFILE_RULES`
+          setting is on, see `quepy.profiling.RuleProfile`. `self.profile`
+          can also dump them sorted by cost.
+        - "batch": how many questions `get_queries_batch` received, how many
+          of them were translated (the distinct ones, plus the repeats whose
+          result was no longer kept) and the ratio of questions that were
+          not translated again.
+        """
+
+        repeated = self._batch_questions - self._batch_distinct
+
+        return {
+            "prefilter": self._rule_index.stats(),
+            "dispatch": self._rule_index.first_words.stats(),
+            "budget": {
+                "aborted": dict(self._aborted),
+                "timed_out": self._timed_out,
+            },
+            "rules": self.profile.stats() if self.profile else {},
+            "batch": {
+                "questions": self._batch_questions,
+                "distinct": self._batch_distinct,
+                "dedup_ratio": (float(repeated) / self._batch_questions
+                                if self._batch_questions else 0.0),
+            },
+        }
+
+    def reset_stats(self):
+        """
+        Sets all the statistics returned by `stats` back to zero.
+        """
+
+        self._rule_index.reset_stats()
+        self._aborted.clear()
+        self._timed_out = 0
+        self._batch_questions = 0
+        self._batch_distinct = 0
+        if self.profile is not None:
+            self.profile.reset()
 
     def get_query(self, question):
         """
@@ -106,11 +202,12 @@ class QuepyApp(object):
         """
 
         question = question_sanitize(question)
-        for target, query, userdata in self.get_queries(question):
+        queries = self.get_queries(question, limit=1, tiered=True)
+        for target, query, userdata in queries:
             return target, query, userdata
         return None, None, None
 
-    def get_queries(self, question):
+    def get_queries(self, question, limit=None, tiered=False):
         """
         Given `question` in natural language, it returns
         three things:
@@ -120,32 +217,273 @@ class QuepyApp(object):
         - metadata given by the regex programmer (defaults to None)
 
         The queries returned corresponds to the regexes that match in
-        weight order.
+        weight order. The matching is limited by the `MATCH_STEP_BUDGET` and
+        `MATCH_TIMEOUT` settings, templates that go over them are skipped.
+
+        At most `limit` queries are returned, no more templates are matched
+        after that. If `tiered` is true the templates are matched by groups
+        of the same weight and only the queries of the first group with an
+        interpretation are returned.
+        """
+
+        forms = self._iter_compiled_forms(question, tiered)
+        for item in self._iter_queries(forms, limit):
+            yield item
+
+    def session(self):
+        """
+        Returns a `quepy.session.MatchSession` to match a question as it is
+        typed: words are appended with `append` or `update` and it tells
+        which templates may still match and which already do, without
+        matching the whole question again after each word.
+        """
+
+        from .session import MatchSession
+
+        return MatchSession(self)
+
+    def get_queries_batch(self, questions, workers=None, executor="process",
+                          chunksize=100, limit=None, tiered=False,
+                          dedup=True, dedup_size=10000):
+        """
+        Translates many questions, yielding a `BatchResult` for each one in
+        the order of `questions`. A question that fails gives a result with
+        the error instead of stopping the batch.
+
+        Questions are tagged here by chunks of `chunksize` (with the
+        `tag_many` of the tagger when it has one) and the chunks are matched
+        and generated by a pool of `workers`. `executor` is "process" or
+        "thread". Each process installs the app once and gets the current
+        values of `quepy.settings`; it doesn't need a tagger.
+        `limit` and `tiered` are as in `get_queries`.
+
+        With `dedup` questions that are the same once normalized (see
+        `quepy.tagger.normalize_question`) are translated once and their
+        result is given for every occurrence (sharing the `queries` list).
+        The results of the last `dedup_size` distinct questions are kept, a
+        repeat of an older one is translated again. How many were saved is
+        reported by `stats`.
+        """
+
+        try:
+            from concurrent.futures import ProcessPoolExecutor, \
+                ThreadPoolExecutor
+        except ImportError:
+            raise ImportError("get_queries_batch needs concurrent.futures, "
+                              "install the 'futures' package on Python 2")
+        import multiprocessing
+        from .cache import LRUCache, MISSING
+        from .tagger import normalize_question
+
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        if executor == "process":
+            pool = ProcessPoolExecutor(workers)
+            setup = (self._parsing_module.__name__,
+                     self._settings_module.__name__, _settings_values())
+            task = partial(_worker_translate, setup)
+        elif executor == "thread":
+            pool = ThreadPoolExecutor(workers)
+            task = self._translate_tagged
+        else:
+            raise ValueError("Executor '{}' is not supported".format(
+                executor))
+
+        questions = iter(questions)
+        numbers = count()
+        order = deque()  # (question, key) of each question, in input order
+        # [result, occurrences in `order`] of the questions in `order`
+        waiting = {}
+        finished = LRUCache(dedup_size if dedup else 0)
+        pending = deque()  # (keys, future) of the chunks in flight
+        with pool:
+            exhausted = False
+            while not exhausted or pending:
+                chunk = []
+                keys = []
+                exhausted = True
+                for read, question in enumerate(questions, 1):
+                    key = normalize_question(question) if dedup else \
+                        next(numbers)
+                    entry = waiting.get(key)
+                    if entry is None:
+                        result = finished.get(key)
+                        if result is MISSING:
+                            result = None
+                            chunk.append(question)
+                            keys.append(key)
+                        entry = waiting[key] = [result, 0]
+                    entry[1] += 1
+                    order.append((question, key))
+                    self._batch_questions += 1
+                    # Repeats count too, so `order` stays bounded
+                    if len(chunk) == chunksize or read == chunksize:
+                        exhausted = False
+                        break
+
+                if chunk:
+                    self._batch_distinct += len(chunk)
+                    future = pool.submit(task, self._tag_chunk(chunk), limit,
+                                         tiered)
+                    pending.append((keys, future))
+                # Keeps a bounded number of chunks in flight, and waits for
+                # one when only repeats were read
+                while pending and (exhausted or not chunk or
+                                   len(pending) > 2 * workers):
+                    keys, future = pending.popleft()
+                    for key, result in zip(keys, future.result()):
+                        waiting[key][0] = result
+                        finished.put(key, result)
+                    if not exhausted:
+                        break
+                while order and waiting[order[0][1]][0] is not None:
+                    question, key = order.popleft()
+                    entry = waiting[key]
+                    entry[1] -= 1
+                    if not entry[1]:
+                        del waiting[key]
+                    yield entry[0]._replace(question=question)
+
+    def _tag_chunk(self, questions):
+        """
+        Returns `(question, words, error)` for each question, where `words`
+        is a `TaggedSentence` or `None` if tagging raised `error`.
+        """
+
+        from .tagger import TaggedSentence
+
+        tag_many = getattr(self.tagger, "tag_many", None)
+        if tag_many is not None:
+            try:
+                return [(question, TaggedSentence.from_words(words), None)
+                        for question, words in
+                        zip(questions, tag_many(questions))]
+            except Exception:
+                # Tagged one by one to know which questions fail
+                pass
+
+        result = []
+        for question in questions:
+            try:
+                words = TaggedSentence.from_words(self.tagger(question))
+            except Exception as error:
+                result.append((question, None, error))
+            else:
+                result.append((question, words, None))
+        return result
+
+    def _translate_tagged(self, items, limit=None, tiered=False):
         """
-        for expression, userdata in self._iter_compiled_forms(question):
+        Returns a `BatchResult` for each `(question, words, error)` given by
+        `_tag_chunk`.
+        """
+
+        results = []
+        for question, words, error in items:
+            if error is None:
+                try:
+                    forms = self._iter_word_forms(words, tiered)
+                    queries = list(self._iter_queries(forms, limit))
+                except Exception as exception:
+                    error = exception
+            if error is not None:
+                logger.warning("Can't translate '%s': %s", question, error)
+                queries = None
+            results.append(BatchResult(question, queries, error))
+        return results
+
+    def _iter_queries(self, forms, limit):
+        if limit is not None:
+            forms = islice(forms, limit)
+        for expression, userdata in forms:
             target, query = generation.get_code(expression, self.language)
             logger.debug("Interpretation %s: %s", expression.rule_used, expression)
             logger.debug("Query generated: %s", query)
             yield target, query, userdata
 
-    def _iter_compiled_forms(self, question):
+    def _iter_compiled_forms(self, question, tiered=False):
         """
-        Returns all the compiled form of the question.
+        Returns all the compiled form of the question, or with `tiered`
+        those of the heaviest weight that has any.
         """
 
+        from .tagger import TaggedSentence, TaggingError
+
         try:
-            words = list(self.tagger(question))
+            words = TaggedSentence.from_words(self.tagger(question))
         except TaggingError:
             logger.warning("Can't parse tagger's output for: '%s'", question)
             return
 
+        for form in self._iter_word_forms(words, tiered):
+            yield form
+
+    def _iter_word_forms(self, words, tiered=False):
+        """
+        Returns the compiled forms of an already tagged question.
+        """
+
+        from .parsing import eol_terminated, MatchBudget
+
         logger.debug("Tagged question:\n" +
                      "\n".join("\t{}".format(w for w in words)))
 
+        budget = None
+        if settings.MATCH_STEP_BUDGET is not None or \
+                settings.MATCH_TIMEOUT is not None:
+            budget = MatchBudget(settings.MATCH_STEP_BUDGET,
+                                 settings.MATCH_TIMEOUT)
+
+        sequence = eol_terminated(words)
+        candidates = self._rule_index.candidates(words)
+        if tiered:
+            # Candidates keep the weight order of `self.rules`
+            tiers = [list(tier) for _, tier in
+                     groupby(candidates, key=attrgetter("weight"))]
+        else:
+            tiers = [candidates]
+
+        try:
+            for tier in tiers:
+                found = False
+                matches = self._engine.matches(tier, sequence, budget,
+                                               self.profile)
+                for rule, match in matches:
+                    expression, userdata = rule.interpret_match(
+                        match, words, self.profile)
+                    if expression:
+                        found = True
+                        yield expression, userdata
+                if found or (budget is not None and budget.timed_out):
+                    break
+        finally:
+            if budget is not None:
+                self._count_aborted(budget)
+
+    def _count_aborted(self, budget):
+        for rule, _ in budget.aborted:
+            self._aborted[rule.__class__.__name__] += 1
+        if budget.timed_out:
+            self._timed_out += 1
+
+    def _setup_matching(self):
+        """
+        Compiles the templates and builds the structures used to match them.
+        """
+
+        from .analysis import RuleIndex
+        from .engines import get_engine
+        from .profiling import RuleProfile
+
         for rule in self.rules:
-            expression, userdata = rule.get_interpretation(words)
-            if expression:
-                yield expression, userdata
+            rule.compile()
+        self._aborted = Counter()
+        self._timed_out = 0
+        self._batch_questions = 0
+        self._batch_distinct = 0
+        self.profile = RuleProfile() if settings.PROFILE_RULES else None
+        self._rule_index = RuleIndex(self.rules)
+        self._engine = get_engine(self.rules, settings.MATCHING_ENGINE)
 
     def _save_settings_values(self):
         """
@@ -157,3 +495,29 @@ class QuepyApp(object):
             if key.upper() == key:
                 value = getattr(self._settings_module, key)
                 setattr(settings, key, value)
+
+
+def _settings_values():
+    return {key: getattr(settings, key) for key in dir(settings)
+            if key.upper() == key}
+
+
+# The app of a worker process of `QuepyApp.get_queries_batch`
+_worker_app = None
+
+
+def _init_worker(parsing_name, settings_name, values):
+    global _worker_app
+    _worker_app = QuepyApp(import_module(parsing_name),
+                           import_module(settings_name))
+    # Settings changed by the parent after installing its app
+    for key, value in values.items():
+        setattr(settings, key, value)
+
+
+def _worker_translate(setup, items, limit, tiered):
+    # The app is installed by the first chunk the process gets, executors
+    # before Python 3.7 (and the Python 2 backport) have no initializer
+    if _worker_app is None:
+        _init_worker(*setup)
+    return _worker_app._translate_tagged(items, limit, tiered)
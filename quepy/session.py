@@ -0,0 +1,171 @@
+# coding: utf-8
+
+# Copyright (c) 2012, Machinalis S.R.L.
+# This file is part of quepy and is distributed under the Modified BSD License.
+# You should have received a copy of license in the LICENSE file.
+#
+# Authors: Rafael Carrascosa <rcarrascosa@machinalis.com>
+#          Gonzalo Garcia Berrotaran <ggarcia@machinalis.com>
+
+from __future__ import absolute_import, unicode_literals
+
+"""
+Incremental matching of a question that is being typed, see
+`QuepyApp.session`.
+"""
+
+import logging
+
+from refo.match import Match as RefoMatch
+from refo.virtualmachine import VirtualMachine
+
+from quepy.parsing import _EOL
+from quepy.tagger import TaggedSentence, TaggingError
+
+logger = logging.getLogger("quepy.session")
+
+
+def _feed(code, threads, item):
+    """
+    Returns the threads of the refo VM running `code` after feeding `item`
+    to `threads`, which are left untouched.
+    """
+
+    vm = VirtualMachine(code)
+    vm.threads = [thread.copy(thread.pc) for thread in threads]
+    vm.feed(item)
+    vm.do_epsilon_transitions()
+    return vm.threads
+
+
+class MatchSession(object):
+    """
+    Matches the templates of an app against a question as it grows, keeping
+    the tagged words and the refo VM threads of every template after each
+    word. Appending words only feeds the new words to the templates that are
+    still alive, instead of matching the whole question again.
+
+    The compiled templates only accept at the end of line mark, so the
+    threads kept never accept and feeding them the words one at a time is
+    the same as matching the whole question with `QuestionTemplate.match`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.text = ""
+        self.words = TaggedSentence([], [], [])
+        # `self._states[i]` has `(position, threads)` for each template still
+        # alive after the first `i` words
+        initial = []
+        for position, rule in enumerate(app.rules):
+            vm = VirtualMachine(rule._code or rule.compile())
+            vm.do_epsilon_transitions()
+            initial.append((position, vm.threads))
+        self._states = [initial]
+        self._accepting = None
+
+    def append(self, text):
+        """
+        Appends `text`, one or more whole words, to the question. Only `text`
+        is tagged, so the tags of the words already in the question are kept
+        as they are.
+        """
+
+        words = self._tag(text)
+        if words is None:
+            return
+        self._advance(list(self.words) + list(words), len(self.words))
+        self.text += text
+
+    def update(self, text):
+        """
+        Sets the question to `text`, e.g. the whole content of a text box.
+        `text` is tagged again, but the templates are only fed the words
+        from the first one that changed.
+        """
+
+        words = self._tag(text)
+        if words is None:
+            return
+        common = 0
+        for old, new in zip(self.words, words):
+            if (old.token, old.lemma, old.pos) != \
+                    (new.token, new.lemma, new.pos):
+                break
+            common += 1
+        self._advance(list(words), common)
+        self.text = text
+
+    def viable(self):
+        """
+        Returns the templates that may still match if more words are
+        appended, in weight order.
+        """
+
+        rules = self.app.rules
+        return [rules[position] for position, _ in self._states[-1]]
+
+    def accepting(self):
+        """
+        Returns `(rule, match)`, with a refo match, for each template that
+        matches the current words as a whole question, in weight order.
+        """
+
+        if self._accepting is None:
+            rules = self.app.rules
+            self._accepting = []
+            for position, threads in self._states[-1]:
+                code = rules[position]._code
+                vm = VirtualMachine(code)
+                vm.threads = _feed(code, threads, _EOL)
+                state = vm.accepting_state(None)
+                if state is not None:
+                    match = RefoMatch()
+                    match.state = state
+                    self._accepting.append((rules[position], match))
+        return self._accepting
+
+    def get_queries(self, limit=None):
+        """
+        Returns the queries of the current words as `QuepyApp.get_queries`
+        does, but only interpreting the matches of the templates that accept
+        (see `accepting`).
+        """
+
+        forms = self._iter_forms()
+        for item in self.app._iter_queries(forms, limit):
+            yield item
+
+    def _iter_forms(self):
+        for rule, match in self.accepting():
+            expression, userdata = rule.interpret_match(match, self.words,
+                                                        self.app.profile)
+            if expression:
+                yield expression, userdata
+
+    def _tag(self, text):
+        if not text.strip():
+            return []
+        try:
+            return TaggedSentence.from_words(self.app.tagger(text))
+        except TaggingError:
+            logger.warning("Can't parse tagger's output for: '%s'", text)
+            return None
+
+    def _advance(self, words, start):
+        """
+        Sets the words of the question to `words`, of which the first
+        `start` are the same as before, and feeds the rest to the templates.
+        """
+
+        rules = self.app.rules
+        del self._states[start + 1:]
+        self.words = TaggedSentence.from_words(words)
+        for word in self.words.words[start:]:
+            state = []
+            for position, threads in self._states[-1]:
+                threads = _feed(rules[position]._code, threads, word)
+                if threads:
+                    state.append((position, threads))
+            self._states.append(state)
+        self._accepting = None
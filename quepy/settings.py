@@ -16,8 +16,29 @@ Settings.
 # Generated query language
 LANGUAGE = "sparql"
 
+# Tagger config
+TAGGER = "nltk"  # Tagging backend: "nltk" or "spacy"
+
 # NLTK config
 NLTK_DATA_PATH = []  # List of paths with NLTK data
+LEMMA_CACHE_SIZE = 10000  # Memoized lemmas, None for unbounded, 0 disables
+
+# spaCy config
+SPACY_MODEL = "en_core_web_sm"  # Name or path of the spaCy model to load
+SPACY_BATCH_SIZE = 1000  # Strings per batch given to `nlp.pipe`
+SPACY_N_PROCESS = 1  # Processes used by `nlp.pipe`, -1 for all CPUs
+
+# Tagged questions cache config
+TAG_CACHE = None  # Policy: "lru", "ttl", "sqlite" or None to disable
+TAG_CACHE_SIZE = 10000  # Max number of cached questions
+TAG_CACHE_TTL = 3600  # Seconds a question stays cached with "ttl"
+TAG_CACHE_PATH = "quepy_tags.sqlite3"  # File shared by processes with "sqlite"
+
+# Matching config
+MATCHING_ENGINE = "sequential"  # "sequential", "combined", "regex" or "memo"
+MATCH_STEP_BUDGET = None  # Max VM steps per template and question
+MATCH_TIMEOUT = None  # Seconds to match a question, None for no limit
+PROFILE_RULES = False  # Count attempts and time spent per template
 
 # Encoding config
 DEFAULT_ENCODING = "utf-8"
@@ -0,0 +1,83 @@
+# coding: utf-8
+
+# Copyright (c) 2012, Machinalis S.R.L.
+# This file is part of quepy and is distributed under the Modified BSD License.
+# You should have received a copy of license in the LICENSE file.
+#
+# Authors: Rafael Carrascosa <rcarrascosa@machinalis.com>
+#          Gonzalo Garcia Berrotaran <ggarcia@machinalis.com>
+
+from __future__ import absolute_import, unicode_literals
+
+"""
+Tagging using spaCy.
+"""
+
+# Required data files are:
+#   - an english model, e.g. "en_core_web_sm"
+
+from builtins import str
+
+import spacy
+
+from .tagger import TaggedSentence
+
+# Pipeline components that don't contribute to `tag_` or `lemma_`
+UNUSED_COMPONENTS = ["parser", "ner", "senter", "entity_ruler",
+                     "entity_linker", "textcat", "textcat_multilabel"]
+
+
+def _spacy_major_version():
+	# type: () -> int
+
+	return int(spacy.__version__.split(".")[0])
+
+
+class run_spacytagger(object):
+
+	def __init__(self, model="en_core_web_sm", batch_size=1000, n_process=1):
+		if _spacy_major_version() >= 3:
+			# Excluded components aren't even loaded
+			self.nlp = spacy.load(model, exclude=UNUSED_COMPONENTS)
+		else:
+			# spaCy 2 passes unknown arguments like `exclude` to `Language`,
+			# which ignores them
+			self.nlp = spacy.load(model, disable=UNUSED_COMPONENTS)
+		self.batch_size = batch_size
+		self.n_process = n_process
+
+	@staticmethod
+	def convert_to_quepy(doc):
+		# type: (spacy.tokens.Doc, ) -> TaggedSentence
+
+		return TaggedSentence([token.text for token in doc],
+			[token.lemma_ for token in doc], [token.tag_ for token in doc])
+
+	def __call__(self, string):
+		# type: (str) -> TaggedSentence
+
+		"""
+		Runs spaCy on `string` and returns its
+		:class:`quepy.tagger.TaggedSentence`.
+		"""
+
+		if not isinstance(string, str):
+			raise TypeError("Input must be a unicode string")
+
+		return self.convert_to_quepy(self.nlp(string))
+
+	def tag_many(self, strings, chunksize=None):
+		# type: (Iterable[str], Optional[int]) -> Iterator[TaggedSentence]
+
+		"""
+		Runs spaCy on every string of `strings` through `nlp.pipe` and yields
+		a :class:`quepy.tagger.TaggedSentence` for each one, in input order.
+		`chunksize` overrides the `batch_size` given to the tagger.
+		"""
+
+		kwargs = {"batch_size": chunksize or self.batch_size}
+		if self.n_process != 1:
+			kwargs["n_process"] = self.n_process
+
+		for doc in self.nlp.pipe(strings, **kwargs):
+			yield self.convert_to_quepy(doc)
@@ -12,15 +12,37 @@ from __future__ import absolute_import, unicode_literals
 from future.utils import python_2_unicode_compatible
 from builtins import str
 
+import sys
 import logging
+import threading
+import unicodedata
+from itertools import islice
+from collections import namedtuple
+
+try:
+    from sys import intern
+except ImportError:
+    # Python 2 can only intern byte strings
+    _interned = {}
+
+    def intern(string):
+        return _interned.setdefault(string, string)
 
 from . import settings
+from .cache import MISSING, get_setting
 
 logger = logging.getLogger("quepy.tagger")
 PENN_TAGSET = set("$ `` '' ( ) , -- . : CC CD DT EX FW IN JJ JJR JJS LS MD "
     "NN NNP NNPS NNS PDT POS PRP PRP$ RB RBR RBS RP SYM TO UH "
     "VB VBD VBG VBN VBP VBZ WDT WP WP$ WRB".split())
 
+# Tagged by `warmup` to load the models, covers every wordnet POS
+WARMUP_TEXT = "Which famous movies did the actors quickly direct?"
+
+# Number of strings handed at once to the backend by `tag_many` when the
+# backend doesn't define its own
+DEFAULT_CHUNKSIZE = 1000
+
 
 class TaggingError(Exception):
     """
@@ -28,23 +50,6 @@ class TaggingError(Exception):
     """
     pass
 
-class run_spacytagger(object):
-
-	def __init__(self):
-		import spacy
-		self.nlp = spacy.load("en")
-
-	@staticmethod
-	def convert_to_quepy(doc):
-		for ent in doc:
-			w = Word(ent.text)
-			w.pos = ent.tag_
-			w.lemma = ent.lemma_
-			yield w
-
-	def __call__(self, string):
-		return list(self.convert_to_quepy(self.nlp(string)))
-
 @python_2_unicode_compatible
 class Word(object):
     """
@@ -101,27 +106,360 @@ class Word(object):
 
         self._pos = value
 
-def get_tagger():
-    # type: () -> Callable
+def _intern(value):
+    if value is None:
+        return None
+    return intern(value)
+
+
+@python_2_unicode_compatible
+class TaggedWord(namedtuple("TaggedWord", "token lemma pos prob")):
+    """
+    Read-only word of a `TaggedSentence`.
+    Has the same attributes as `Word` so it can be used where a `Word` is
+    read, e.g. by predicates and `interpret` code.
+    """
+
+    __slots__ = ()
+
+    def __str__(self):
+        return "|".join([self.token, self.lemma or "", self.pos or "",
+                         str(self.prob)])
+
+    def __repr__(self):
+        return str(self)
+
+
+class TaggedSentence(object):
+    """
+    The tagged words of a question, stored as parallel tuples of interned
+    tokens, lemmas and POS tags. This is what the tagging backends build.
+    Since predicates intern their argument too, their `==` comparisons
+    against a word take the fast path of equal strings, being the same
+    object.
+    Indexing and iteration give `TaggedWord` views, built once per sentence.
+    """
+
+    __slots__ = ("tokens", "lemmas", "pos_tags", "probs", "_words")
+
+    def __init__(self, tokens, lemmas, pos_tags, probs=None):
+        self.tokens = tuple(intern(token) for token in tokens)
+        self.lemmas = tuple(_intern(lemma) for lemma in lemmas)
+        self.pos_tags = tuple(_intern(pos) for pos in pos_tags)
+        if probs is None:
+            probs = (None,) * len(self.tokens)
+        self.probs = tuple(probs)
+        if not (len(self.tokens) == len(self.lemmas) == len(self.pos_tags) ==
+                len(self.probs)):
+            raise ValueError("Tokens, lemmas, POS tags and probabilities "
+                             "must have the same length")
+        self._words = None
+
+    @classmethod
+    def from_words(cls, words):
+        # type: (Iterable[Word], ) -> TaggedSentence
+
+        """
+        Returns the sentence of `words`, or `words` itself if it's already
+        a `TaggedSentence`.
+        """
+
+        if isinstance(words, TaggedSentence):
+            return words
+        words = list(words)
+        return cls([w.token for w in words], [w.lemma for w in words],
+                   [w.pos for w in words], [w.prob for w in words])
+
+    @property
+    def words(self):
+        # type: () -> Tuple[TaggedWord, ...]
+
+        if self._words is None:
+            self._words = tuple(map(TaggedWord, self.tokens, self.lemmas,
+                                    self.pos_tags, self.probs))
+        return self._words
+
+    def to_words(self):
+        # type: () -> List[Word]
+
+        return [Word(*word) for word in self.words]
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def __getitem__(self, index):
+        return self.words[index]
+
+    def __repr__(self):
+        return "TaggedSentence({!r})".format(list(self.words))
+
+    def __reduce__(self):
+        # Pickled as its tuples, interned again when unpickled
+        return TaggedSentence, (self.tokens, self.lemmas, self.pos_tags,
+                                self.probs)
+
+
+class TaggerWrapper(object):
+    """
+    Wraps a tagging backend and checks that it emits Penn tags.
+    """
+
+    def __init__(self, tagger_function):
+        self.tagger_function = tagger_function
+
+    def _check_tags(self, words):
+        # type: (TaggedSentence, ) -> TaggedSentence
+
+        if isinstance(words, TaggedSentence):
+            pos_tags = words.pos_tags
+        else:
+            pos_tags = [word.pos for word in words]
+        for pos in pos_tags:
+            if pos not in PENN_TAGSET:
+                logger.warning("Tagger emitted a non-penn POS tag {!r}".format(pos))
+        return words
+
+    def __call__(self, string):
+        # type: (str, ) -> TaggedSentence
+
+        return self._check_tags(self.tagger_function(string))
+
+    def tag_many(self, strings, chunksize=None):
+        # type: (Iterable[str], Optional[int]) -> Iterator[TaggedSentence]
+
+        """
+        Tags every string of `strings` and yields the `TaggedSentence` (or
+        the list of `Word` of backends that don't build one) for each one,
+        in input order.
+        If the backend supports batching, input is streamed to it in chunks
+        of `chunksize` strings, `None` leaves the size to the backend.
+        """
+
+        tag_many = getattr(self.tagger_function, "tag_many", None)
+        if tag_many is not None:
+            tagged = tag_many(strings, chunksize=chunksize)
+        else:
+            tagged = (self.tagger_function(string) for string in strings)
+
+        for words in tagged:
+            yield self._check_tags(words)
+
+    def warmup(self):
+        """
+        Forces the backend to load its lazily loaded models and data.
+        """
+
+        warmup = getattr(self.tagger_function, "warmup", None)
+        if warmup is not None:
+            warmup()
+        else:
+            self.tagger_function(WARMUP_TEXT)
+
+
+def normalize_question(question):
+    # type: (str, ) -> str
+
+    """
+    Returns the form of `question` used as key to cache its tags.
+    Only differences that can't change the tagging are removed, case is
+    kept because it changes the POS tags.
+    """
+
+    question = unicodedata.normalize("NFC", question)
+    return " ".join(question.split())
+
+
+class CachedTagger(object):
+    """
+    Wraps a tagger and caches its output keyed by the normalized question.
+    Words are stored as tuples and returned as a read-only
+    `TaggedSentence`, so callers can't modify the cached values.
+    `namespace` is prepended to the keys, so taggers configured differently
+    can share a cache that outlives them (see `tag_cache_namespace`).
+    """
+
+    def __init__(self, tagger, cache, namespace=""):
+        self.tagger = tagger
+        self.cache = cache
+        self.namespace = namespace
+
+    def _key(self, string):
+        # type: (str, ) -> str
+
+        key = normalize_question(string)
+        if self.namespace:
+            # Normalized questions have no newlines
+            key = self.namespace + "\n" + key
+        return key
+
+    @staticmethod
+    def _freeze(words):
+        # type: (TaggedSentence, ) -> Tuple[Tuple[str, str, str, Any], ...]
+
+        if isinstance(words, TaggedSentence):
+            return tuple(zip(words.tokens, words.lemmas, words.pos_tags,
+                             words.probs))
+        return tuple((w.token, w.lemma, w.pos, w.prob) for w in words)
+
+    @staticmethod
+    def _thaw(tags):
+        # type: (Tuple[Tuple[str, str, str, Any], ...], ) -> TaggedSentence
+
+        if not tags:
+            return TaggedSentence((), (), ())
+        return TaggedSentence(*zip(*tags))
+
+    def __call__(self, string):
+        # type: (str, ) -> TaggedSentence
+
+        key = self._key(string)
+        tags = self.cache.get(key)
+        if tags is MISSING:
+            tags = self._freeze(self.tagger(string))
+            self.cache.put(key, tags)
+        return self._thaw(tags)
+
+    def tag_many(self, strings, chunksize=None):
+        # type: (Iterable[str], Optional[int]) -> Iterator[TaggedSentence]
+
+        """
+        Like `TaggerWrapper.tag_many` but only the questions that aren't
+        cached are handed to the wrapped tagger.
+        """
+
+        strings = iter(strings)
+        while True:
+            chunk = list(islice(strings, chunksize or DEFAULT_CHUNKSIZE))
+            if not chunk:
+                break
+
+            keys = [self._key(string) for string in chunk]
+            tagged = [self.cache.get(key) for key in keys]
+            missing = [i for i, tags in enumerate(tagged) if tags is MISSING]
+            if missing:
+                new = self.tagger.tag_many((chunk[i] for i in missing),
+                                           chunksize=chunksize)
+                for i, words in zip(missing, new):
+                    tagged[i] = self._freeze(words)
+                    self.cache.put(keys[i], tagged[i])
+
+            for tags in tagged:
+                yield self._thaw(tags)
+
+    def warmup(self):
+        self.tagger.warmup()
+
+
+def _nltk_tagger(config):
+    from quepy.nltktagger import run_nltktagger
+    return run_nltktagger(get_setting("NLTK_DATA_PATH", config),
+                          get_setting("LEMMA_CACHE_SIZE", config))
+
+
+def _spacy_tagger(config):
+    from quepy.spacytagger import run_spacytagger
+    return run_spacytagger(get_setting("SPACY_MODEL", config),
+                           get_setting("SPACY_BATCH_SIZE", config),
+                           get_setting("SPACY_N_PROCESS", config))
+
+
+# Tagging backends available to the `TAGGER` setting, built from the
+# settings values in `config` (see `quepy.cache.get_setting`). Backends are
+# imported when chosen, so unused ones (and their models) are never loaded.
+TAGGERS = {
+    "nltk": _nltk_tagger,
+    "spacy": _spacy_tagger,
+}
+
+
+# Settings that change the output or the models of a tagger
+TAGGER_SETTINGS = ("TAGGER", "NLTK_DATA_PATH", "LEMMA_CACHE_SIZE",
+                   "SPACY_MODEL", "SPACY_BATCH_SIZE", "SPACY_N_PROCESS")
+
+# Settings that change the tags given by a tagger
+TAG_SETTINGS = ("TAGGER", "NLTK_DATA_PATH", "SPACY_MODEL")
+
+
+def _setting_values(names, config):
+    values = []
+    for name in names:
+        value = get_setting(name, config)
+        if isinstance(value, list):
+            value = tuple(value)
+        values.append(value)
+    return values
+
+
+def tag_cache_namespace(config=None):
+    # type: (Optional[Dict[str, Any]], ) -> str
+
+    """
+    Returns the namespace of the cached tags of the tagger settings in
+    `config` (`quepy.settings` if `None`) and the version of the backend
+    library, so tags cached on disk by another configuration aren't used.
+    """
+
+    values = _setting_values(TAG_SETTINGS, config)
+    backend = sys.modules.get(get_setting("TAGGER", config))
+    values.append(getattr(backend, "__version__", None))
+    return repr(tuple(values))
+
+
+# Taggers shared by the whole process, keyed by `_tagger_key()`
+_tagger_pool = {}
+_tagger_pool_lock = threading.Lock()
+
+
+def _tagger_key(config=None):
+    return tuple(_setting_values(TAGGER_SETTINGS, config))
+
+
+def _build_tagger(config=None):
+    name = get_setting("TAGGER", config)
+    try:
+        factory = TAGGERS[name]
+    except KeyError:
+        raise ValueError("Tagger '{}' is not supported".format(name))
+
+    return TaggerWrapper(factory(config))
+
+
+def get_tagger(shared=True, config=None):
+    # type: (bool, Optional[Dict[str, Any]]) -> TaggerWrapper
 
     """
     Return a tagging function given some app settings.
     `Settings` is the settings module of an app.
     The returned value is a function that receives a string and returns
-    a list of `Word` instances.
+    its `TaggedSentence`. It also provides `tag_many` to tag an iterable of
+    strings in batches.
+    The backend is chosen by the `TAGGER` setting, read from `config`, a
+    mapping of settings values, or from `quepy.settings` if it's `None`.
+
+    If `shared` is True the tagger is taken from a process-wide pool, so
+    apps with the same tagger settings load its models only once.
     """
 
-    from quepy.nltktagger import run_nltktagger as pos_tagger
-    # pos_tagger = run_spacytagger
+    if not shared:
+        return _build_tagger(config)
 
-    tagger_function = pos_tagger(settings.NLTK_DATA_PATH)
+    key = _tagger_key(config)
+    with _tagger_pool_lock:
+        try:
+            return _tagger_pool[key]
+        except KeyError:
+            pass
+        tagger = _tagger_pool[key] = _build_tagger(config)
+        return tagger
 
-    def wrapper(string):
-        # type: (str, ) -> List[str]
 
-        words = tagger_function(string)
-        for word in words:
-            if word.pos not in PENN_TAGSET:
-                logger.warning("Tagger emitted a non-penn POS tag {!r}".format(word.pos))
-        return words
-    return wrapper
+def clear_tagger_pool():
+    """
+    Drops the shared taggers, they are built again when requested.
+    """
+
+    with _tagger_pool_lock:
+        _tagger_pool.clear()
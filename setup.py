@@ -31,6 +31,7 @@ setup(
         "Topic :: Utilities",
         ],
     packages=["quepy"],
-    install_requires=["refo", "nltk", "SPARQLWrapper", "docopt"],
+    install_requires=["refo", "nltk", "SPARQLWrapper", "docopt",
+                      "futures; python_version < '3'"],
     scripts=["scripts/quepy"]
 )
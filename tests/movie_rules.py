@@ -0,0 +1,67 @@
+# coding: utf-8
+
+# Copyright (c) 2012, Machinalis S.R.L.
+# This file is part of quepy and is distributed under the Modified BSD License.
+# You should have received a copy of license in the LICENSE file.
+#
+# Authors: Rafael Carrascosa <rcarrascosa@machinalis.com>
+#          Gonzalo Garcia Berrotaran <ggarcia@machinalis.com>
+
+from __future__ import absolute_import, unicode_literals
+
+"""
+Movie templates shared by the matching tests.
+"""
+
+from refo import Star, Plus, Question, Any
+
+from quepy.parsing import QuestionTemplate, Particle, Lemma, Pos, LemmasIn
+from quepy.tagger import Word, TaggedSentence
+
+nouns = Plus(Pos("NN") | Pos("NNP"))
+
+
+class Movie(Particle):
+    regex = Question(Pos("DT")) + nouns
+
+
+class Director(Particle):
+    regex = nouns
+
+
+class ListMovies(QuestionTemplate):
+    regex = Lemma("list") + (Lemma("movie") | Lemma("film"))
+
+
+class MoviesBy(QuestionTemplate):
+    regex = Question(Lemma("list")) + Lemma("movie") + Lemma("by") + \
+        Director()
+
+
+class WhatIs(QuestionTemplate):
+    regex = Lemma("what") + Lemma("be") + Movie() + Question(Pos("."))
+
+
+class WhoIs(QuestionTemplate):
+    regex = LemmasIn("who what") + Lemma("be") + Director()
+
+
+class StartsWithList(QuestionTemplate):
+    regex = Lemma("list") + Star(Any())
+
+
+class AnythingBy(QuestionTemplate):
+    regex = Star(Any(), greedy=False) + Lemma("by") + Director()
+
+
+def tagged(text):
+    """
+    Tags `text`, made of "token/POS" items, lemmatized as the lowercase
+    token.
+    """
+
+    words = []
+    for item in text.split():
+        token, pos = item.split("/")
+        words.append(Word(token, token.lower(), pos))
+    return TaggedSentence.from_words(words)
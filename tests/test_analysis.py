@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) 2012, Machinalis S.R.L.
+# This file is part of quepy and is distributed under the Modified BSD License.
+# You should have received a copy of license in the LICENSE file.
+#
+# Authors: Rafael Carrascosa <rcarrascosa@machinalis.com>
+#          Gonzalo Garcia Berrotaran <ggarcia@machinalis.com>
+
+from __future__ import absolute_import, unicode_literals
+
+"""
+Tests for regex analysis.
+"""
+
+import unittest
+from refo import Star, Plus, Question, Any
+
+from quepy.analysis import required_literals, length_bounds, \
+    first_literals, FirstWordIndex, RuleIndex
+from quepy.parsing import QuestionTemplate, Particle, Lemma, Pos, Token, \
+    PosIn, eol_terminated
+from quepy.tagger import Word, TaggedSentence
+
+
+def clauses(*args):
+    return frozenset(frozenset(clause) for clause in args)
+
+
+class Movie(Particle):
+    regex = Question(Pos("DT")) + Plus(Pos("NN") | Pos("NNP"))
+
+
+class TestRequiredLiterals(unittest.TestCase):
+    def test_predicates(self):
+        self.assertEqual(required_literals(Lemma("list")),
+                         clauses([("lemma", "list")]))
+        self.assertEqual(required_literals(Token("List")),
+                         clauses([("token", "List")]))
+        self.assertEqual(required_literals(Pos("NN")),
+                         clauses([("pos", "NN")]))
+        self.assertEqual(required_literals(Any()), clauses())
+
+    def test_set_predicates(self):
+        self.assertEqual(required_literals(PosIn(["NN", "NNS"])),
+                         clauses([("pos", "NN"), ("pos", "NNS")]))
+
+    def test_concatenation_and_disjunction(self):
+        regex = Lemma("list") + (Lemma("movie") | Lemma("film"))
+        self.assertEqual(required_literals(regex), clauses(
+            [("lemma", "list")],
+            [("lemma", "movie"), ("lemma", "film")]))
+
+    def test_optional(self):
+        regex = Question(Lemma("list")) + Star(Lemma("a")) + Lemma("movie")
+        self.assertEqual(required_literals(regex),
+                         clauses([("lemma", "movie")]))
+
+    def test_disjunction_with_optional_side(self):
+        regex = Lemma("list") | Star(Any())
+        self.assertEqual(required_literals(regex), clauses())
+
+    def test_particle(self):
+        self.assertEqual(required_literals(Lemma("by") + Movie()), clauses(
+            [("lemma", "by")], [("pos", "NN"), ("pos", "NNP")]))
+
+    def test_repetition(self):
+        self.assertEqual(required_literals(Lemma("a") * 2),
+                         clauses([("lemma", "a")]))
+        self.assertEqual(required_literals(Lemma("a") * (0, 2)), clauses())
+
+    def test_unknown_predicate_subclass(self):
+        class Lowercase(Token):
+            def _check(self, word):
+                return word.token.lower() == self.tag
+
+        self.assertEqual(required_literals(Lowercase("list")), clauses())
+
+
+class TestLengthBounds(unittest.TestCase):
+    def test_bounds(self):
+        self.assertEqual(length_bounds(Lemma("a")), (1, 1))
+        self.assertEqual(length_bounds(Lemma("a") + Pos("NN")), (2, 2))
+        self.assertEqual(length_bounds(Question(Lemma("a")) + Lemma("b")),
+                         (1, 2))
+        self.assertEqual(length_bounds(Lemma("a") | Lemma("b") + Lemma("c")),
+                         (1, 2))
+        self.assertEqual(length_bounds(Star(Any())), (0, None))
+        self.assertEqual(length_bounds(Lemma("a") + Plus(Pos("NN"))),
+                         (2, None))
+        self.assertEqual(length_bounds(Movie()), (1, None))
+        self.assertEqual(length_bounds(Lemma("a") * (2, 3)), (2, 3))
+        self.assertEqual(length_bounds((Lemma("a") + Lemma("b")) * 2), (4, 4))
+
+
+class TestFirstLiterals(unittest.TestCase):
+    def test_predicates(self):
+        self.assertEqual(first_literals(Lemma("list") + Lemma("movie")),
+                         ({("lemma", "list")}, False))
+        self.assertEqual(first_literals(PosIn(["NN", "NNS"])),
+                         ({("pos", "NN"), ("pos", "NNS")}, False))
+        self.assertEqual(first_literals(Any() + Lemma("by")), (None, False))
+
+    def test_optional_prefix(self):
+        regex = Question(Lemma("list")) + Lemma("movie")
+        self.assertEqual(first_literals(regex),
+                         ({("lemma", "list"), ("lemma", "movie")}, False))
+        self.assertEqual(first_literals(Star(Any()) + Lemma("by")),
+                         (None, False))
+        self.assertEqual(first_literals(Movie()),
+                         ({("pos", "DT"), ("pos", "NN"), ("pos", "NNP")},
+                          False))
+
+    def test_nullable(self):
+        self.assertEqual(first_literals(Star(Lemma("a"))),
+                         ({("lemma", "a")}, True))
+        self.assertEqual(first_literals(Lemma("a") | Question(Token("b"))),
+                         ({("lemma", "a"), ("token", "b")}, True))
+
+
+class TestFirstWordIndex(unittest.TestCase):
+    def setUp(self):
+        class ListMovies(QuestionTemplate):
+            regex = Lemma("list") + Lemma("movie")
+
+        class WhoIs(QuestionTemplate):
+            regex = (Lemma("who") | Token("Who")) + Lemma("be") + Movie()
+
+        class Named(QuestionTemplate):
+            regex = Pos("NNP") + Star(Any())
+
+        class AnythingBy(QuestionTemplate):
+            regex = Star(Any()) + Lemma("by") + Movie()
+
+        self.index = FirstWordIndex([ListMovies(), WhoIs(), Named(),
+                                     AnythingBy()])
+
+    def candidates(self, words):
+        return [type(rule).__name__ for rule in self.index.candidates(words)]
+
+    def test_candidates(self):
+        self.assertEqual(self.candidates([Word("list", "list", "VB")]),
+                         ["ListMovies", "AnythingBy"])
+        self.assertEqual(self.candidates([Word("Who", "who", "NNP")]),
+                         ["WhoIs", "Named", "AnythingBy"])
+        self.assertEqual(self.candidates([Word("foo", "foo", "NN")]),
+                         ["AnythingBy"])
+        self.assertEqual(len(self.candidates([])), 4)
+
+    def test_stats(self):
+        stats = self.index.stats()
+        self.assertEqual(stats["fallback"], 1)
+        self.assertEqual(stats["buckets"], {"lemma=list": 1, "lemma=who": 1,
+                                            "token=Who": 1, "pos=NNP": 1})
+
+
+class TestRuleIndex(unittest.TestCase):
+    def setUp(self):
+        class ListMovies(QuestionTemplate):
+            regex = Lemma("list") + (Lemma("movie") | Lemma("film"))
+
+        class MoviesBy(QuestionTemplate):
+            regex = Question(Lemma("list")) + Lemma("movie") + Lemma("by") + \
+                Movie()
+
+        class Anything(QuestionTemplate):
+            regex = Star(Any())
+
+        self.rules = [ListMovies(), MoviesBy(), Anything()]
+        self.index = RuleIndex(self.rules)
+
+    def candidates(self, question):
+        words = TaggedSentence.from_words(
+            [Word(x, x, "NN") for x in question.split()])
+        return [type(rule).__name__ for rule in self.index.candidates(words)]
+
+    def test_candidates(self):
+        self.assertEqual(self.candidates("list film"),
+                         ["ListMovies", "Anything"])
+        self.assertEqual(self.candidates("list movie by Tarantino"),
+                         ["MoviesBy", "Anything"])
+        self.assertEqual(self.candidates("who be Tom"), ["Anything"])
+
+    def test_length_pruning(self):
+        self.assertEqual(self.candidates("list film film"), ["Anything"])
+        self.assertEqual(self.index.stats()["pruned_by_length"], 1)
+
+    def test_first_word_pruning(self):
+        self.assertEqual(self.candidates("movie by the list"),
+                         ["MoviesBy", "Anything"])
+        self.assertEqual(self.candidates("by list movie"), ["Anything"])
+        self.assertEqual(self.index.stats()["pruned_by_first_word"], 1)
+
+    def test_stats(self):
+        self.candidates("list film")
+        self.candidates("who be Tom")
+        stats = self.index.stats()
+        self.assertEqual(stats["questions"], 2)
+        self.assertEqual(stats["pruned_by_literals"], 3)
+        self.assertEqual(stats["pruning_ratio"], 0.5)
+
+        self.index.reset_stats()
+        self.assertEqual(self.index.stats()["questions"], 0)
+
+    def test_no_false_negatives(self):
+        for question in ["list film", "list movie", "movie by Tarantino",
+                         "list movie by the Tarantino", "foo"]:
+            sequence = eol_terminated(Word(x, x, "NN") for x in question.split())
+            matching = [type(rule).__name__ for rule in self.rules
+                        if rule.match(sequence)]
+            candidates = self.candidates(question)
+            for name in matching:
+                self.assertIn(name, candidates)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) 2012, Machinalis S.R.L.
+# This file is part of quepy and is distributed under the Modified BSD License.
+# You should have received a copy of license in the LICENSE file.
+#
+# Authors: Rafael Carrascosa <rcarrascosa@machinalis.com>
+#          Gonzalo Garcia Berrotaran <ggarcia@machinalis.com>
+
+from __future__ import absolute_import, unicode_literals
+
+"""
+Tests for cache.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from quepy import settings
+from quepy.cache import LRUCache, TTLCache, SQLiteCache, MISSING, \
+    get_tag_cache
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_get_put(self):
+        cache = LRUCache(2)
+        self.assertIs(cache.get("a"), MISSING)
+        cache.put("a", None)
+        self.assertIs(cache.get("a"), None)
+        self.assertEqual(cache.info(), (1, 1, 2, 1))
+
+    def test_eviction_order(self):
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_disabled(self):
+        cache = LRUCache(0)
+        cache.put("a", 1)
+        self.assertIs(cache.get("a"), MISSING)
+        self.assertEqual(len(cache), 0)
+
+    def test_unbounded(self):
+        cache = LRUCache(None)
+        for i in range(100):
+            cache.put(i, i)
+        self.assertEqual(len(cache), 100)
+
+    def test_clear(self):
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.get("a")
+        cache.clear()
+        self.assertEqual(cache.info(), (0, 0, 2, 0))
+
+
+class FakeTimer(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_expiration(self):
+        timer = FakeTimer()
+        cache = TTLCache(10, ttl=5, timer=timer)
+        cache.put("a", 1)
+        timer.now = 4
+        self.assertEqual(cache.get("a"), 1)
+        timer.now = 5
+        self.assertIs(cache.get("a"), MISSING)
+        self.assertEqual(cache.info(), (1, 1, 10, 0))
+
+    def test_expired_are_dropped_on_put(self):
+        timer = FakeTimer()
+        cache = TTLCache(10, ttl=5, timer=timer)
+        cache.put("a", 1)
+        timer.now = 3
+        cache.put("b", 2)
+        timer.now = 6
+        cache.put("c", 3)
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn("a", cache)
+
+    def test_bounded(self):
+        cache = TTLCache(2, ttl=5, timer=FakeTimer())
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.put("c", 3)
+        self.assertNotIn("a", cache)
+        self.assertEqual(len(cache), 2)
+
+
+class TestSQLiteCache(unittest.TestCase):
+    words = (("Who", "who", "WP", None), ("is", "be", "VBZ", 0.5))
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "tags.sqlite3")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_get_put(self):
+        cache = SQLiteCache(self.path)
+        self.assertIs(cache.get("Who is"), MISSING)
+        cache.put("Who is", self.words)
+        self.assertEqual(cache.get("Who is"), self.words)
+        self.assertEqual(cache.info(), (1, 1, None, 1))
+
+    def test_shared_between_instances(self):
+        SQLiteCache(self.path).put("Who is", self.words)
+        other = SQLiteCache(self.path)
+        self.assertIn("Who is", other)
+        self.assertEqual(other.get("Who is"), self.words)
+
+    def test_prune(self):
+        cache = SQLiteCache(self.path, maxsize=2, prune_every=1)
+        for question in ["a", "b", "c"]:
+            cache.put(question, self.words)
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn("a", cache)
+
+    def test_clear(self):
+        cache = SQLiteCache(self.path)
+        cache.put("Who is", self.words)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+class TestGetTagCache(unittest.TestCase):
+    def setUp(self):
+        self.policy = settings.TAG_CACHE
+
+    def tearDown(self):
+        settings.TAG_CACHE = self.policy
+
+    def test_policies(self):
+        settings.TAG_CACHE = None
+        self.assertIs(get_tag_cache(), None)
+        settings.TAG_CACHE = "lru"
+        self.assertIsInstance(get_tag_cache(), LRUCache)
+        settings.TAG_CACHE = "ttl"
+        self.assertIsInstance(get_tag_cache(), TTLCache)
+        settings.TAG_CACHE = "nonexistent"
+        self.assertRaises(ValueError, get_tag_cache)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) 2012, Machinalis S.R.L.
+# This file is part of quepy and is distributed under the Modified BSD License.
+# You should have received a copy of license in the LICENSE file.
+#
+# Authors: Rafael Carrascosa <rcarrascosa@machinalis.com>
+#          Gonzalo Garcia Berrotaran <ggarcia@machinalis.com>
+
+from __future__ import absolute_import, unicode_literals
+
+"""
+Tests for matching engines.
+"""
+
+import unittest
+from refo import Star, Plus, Question, Any, Predicate
+
+from quepy.engines import SequentialEngine, CombinedEngine, RegexEngine, \
+    MemoEngine, get_engine
+from quepy.parsing import QuestionTemplate, Particle, Lemma, Pos, \
+    MatchBudget, eol_terminated
+from quepy.profiling import RuleProfile
+from movie_rules import nouns, Movie, Director, ListMovies, MoviesBy, \
+    WhatIs, WhoIs, StartsWithList, AnythingBy, tagged
+
+
+QUESTIONS = [
+    "list/VB movie/NN",
+    "list/VB film/NN by/IN Tarantino/NNP",
+    "list/VB movie/NN by/IN Quentin/NNP Tarantino/NNP",
+    "movie/NN by/IN Quentin/NNP Tarantino/NNP",
+    "what/WP be/VBZ the/DT Thin/NNP Red/NNP Line/NNP ?/.",
+    "what/WP be/VBZ Pulp/NNP Fiction/NNP",
+    "who/WP be/VBZ Tom/NNP Cruise/NNP",
+    "",
+]
+
+
+class TestEngines(unittest.TestCase):
+    def setUp(self):
+        self.rules = [ListMovies(), MoviesBy(), WhatIs(), WhoIs(),
+                      StartsWithList(), AnythingBy()]
+
+    def matches(self, engine, question):
+        words = tagged(question)
+        sequence = eol_terminated(words)
+        return [(type(rule).__name__, match.state)
+                for rule, match in engine.matches(self.rules, sequence)]
+
+    def test_same_as_sequential(self):
+        sequential = SequentialEngine(self.rules)
+        combined = CombinedEngine(self.rules)
+        for question in QUESTIONS:
+            self.assertEqual(self.matches(combined, question),
+                             self.matches(sequential, question))
+
+    def test_all_accepting_rules(self):
+        combined = CombinedEngine(self.rules)
+        names = [name for name, _ in
+                 self.matches(combined, "list/VB movie/NN by/IN Tom/NNP")]
+        self.assertEqual(names, ["MoviesBy", "StartsWithList", "AnythingBy"])
+
+    def test_group_spans(self):
+        combined = CombinedEngine(self.rules)
+        words = tagged("what/WP be/VBZ the/DT Thin/NNP Red/NNP Line/NNP ?/.")
+        rule, match = next(combined.matches(self.rules, eol_terminated(words)))
+        self.assertIsInstance(rule, WhatIs)
+        particle = [key for key in match if isinstance(key, Movie)][0]
+        self.assertEqual(match[particle], (2, 6))
+
+    def test_subset_of_rules(self):
+        combined = CombinedEngine(self.rules)
+        words = tagged("list/VB movie/NN")
+        matched = [rule for rule, _ in
+                   combined.matches(self.rules[1:5], eol_terminated(words))]
+        self.assertEqual(len(matched), 1)
+        self.assertIsInstance(matched[0], StartsWithList)
+
+    def test_regex_same_as_sequential(self):
+        sequential = SequentialEngine(self.rules)
+        regex = RegexEngine(self.rules)
+        for question in QUESTIONS:
+            self.assertEqual(self.matches(regex, question),
+                             self.matches(sequential, question))
+
+    def test_memo_same_as_sequential(self):
+        sequential = SequentialEngine(self.rules)
+        memo = MemoEngine(self.rules)
+        for question in QUESTIONS:
+            self.assertEqual(self.matches(memo, question),
+                             self.matches(sequential, question))
+
+    def test_memo_shared_particles(self):
+        checked = []
+
+        def noun(word):
+            checked.append(word)
+            return word.pos == "NNP"
+
+        class Name(Particle):
+            regex = Plus(Predicate(noun))
+
+        class Named(Particle):
+            regex = Name.regex
+
+        class WhoIsName(QuestionTemplate):
+            regex = Lemma("who") + Lemma("be") + Name()
+
+        class WhoIsNamed(QuestionTemplate):
+            regex = Lemma("who") + Lemma("be") + Named()
+
+        rules = [WhoIsName(), WhoIsNamed()]
+        words = tagged("who/WP be/VBZ Tom/NNP Cruise/NNP")
+        matched = list(MemoEngine(rules).matches(rules, eol_terminated(words)))
+        self.assertEqual(len(matched), 2)
+        self.assertEqual(len(checked), 2)
+        for _, match in matched:
+            particle = [key for key in match if isinstance(key, Particle)][0]
+            self.assertEqual(match[particle], (2, 4))
+
+    def test_memo_nested_plus(self):
+        class Show(Particle):
+            regex = Plus(Question(Pos("DT")) + nouns)
+
+        class ReleaseDate(QuestionTemplate):
+            regex = Lemma("when") + Lemma("be") + Show() + \
+                Lemma("release") + Question(Pos("."))
+
+        rules = [ReleaseDate()]
+        memo = MemoEngine(rules)
+        sequential = SequentialEngine(rules)
+        for end in ["?/.", "release/VB ?/."]:
+            question = "when/WRB be/VBD " + "Show/NN " * 40 + end
+            sequence = eol_terminated(tagged(question))
+            # Polynomial matching stays far below an exponential number of
+            # predicate checks
+            budget = MatchBudget(steps=10000)
+            matched = [match.state for _, match in
+                       memo.matches(rules, sequence, budget)]
+            self.assertEqual(budget.aborted, [])
+            self.assertEqual(matched, [match.state for _, match in
+                                       sequential.matches(rules, sequence)])
+
+    def test_memo_long_star(self):
+        class Anything(QuestionTemplate):
+            regex = Star(Any())
+
+        rules = [Anything()]
+        sequence = eol_terminated(tagged("word/NN " * 1000))
+        matched = list(MemoEngine(rules).matches(rules, sequence))
+        self.assertEqual(matched[0][1].span(), (0, 1001))
+
+    def test_regex_group_spans(self):
+        regex = RegexEngine(self.rules)
+        words = tagged("movie/NN by/IN Quentin/NNP Tarantino/NNP")
+        matches = dict((type(rule).__name__, match) for rule, match in
+                       regex.matches(self.rules, eol_terminated(words)))
+        for name in ["MoviesBy", "AnythingBy"]:
+            match = matches[name]
+            self.assertEqual(match.span(), (0, 5))
+            particle = [key for key in match if isinstance(key, Director)][0]
+            self.assertEqual(match[particle], (2, 4))
+
+    def test_regex_untranslatable_predicate(self):
+        class Lowercase(Lemma):
+            def _check(self, word):
+                return word.token.lower() == self.tag
+
+        class ListLowercase(QuestionTemplate):
+            regex = Lowercase("list") + Lemma("movie")
+
+        rules = [ListLowercase(), ListMovies()]
+        regex = RegexEngine(rules)
+        words = tagged("LIST/VB movie/NN")
+        matched = [type(rule).__name__ for rule, _ in
+                   regex.matches(rules, eol_terminated(words))]
+        self.assertEqual(matched, ["ListLowercase", "ListMovies"])
+
+    def test_regex_nested_plus(self):
+        class Show(Particle):
+            regex = Plus(Question(Pos("DT")) + nouns)
+
+        class ReleaseDate(QuestionTemplate):
+            regex = Lemma("when") + Lemma("be") + Show() + \
+                Lemma("release") + Question(Pos("."))
+
+        rules = [ReleaseDate(), ListMovies()]
+        regex = RegexEngine(rules)
+        # `re` would backtrack exponentially, so it's matched with refo
+        self.assertNotIn(rules[0], regex._patterns)
+        self.assertIn(rules[1], regex._patterns)
+        words = tagged("when/WRB be/VBD " + "Show/NN " * 40 + "?/.")
+        self.assertEqual(list(regex.matches(rules, eol_terminated(words))),
+                         [])
+        words = tagged("when/WRB be/VBD the/DT Show/NN release/VB")
+        matched = [type(rule).__name__ for rule, _ in
+                   regex.matches(rules, eol_terminated(words))]
+        self.assertEqual(matched, ["ReleaseDate"])
+
+    def test_step_budget(self):
+        # The regex engine runs untranslatable templates only with refo
+        for engine in [SequentialEngine, CombinedEngine]:
+            budget = MatchBudget(steps=8)
+            words = tagged("list/VB movie/NN by/IN Tarantino/NNP")
+            names = [type(rule).__name__ for rule, _ in engine(self.rules)
+                     .matches(self.rules, eol_terminated(words), budget)]
+            self.assertEqual(names, ["MoviesBy"])
+            aborted = [type(rule).__name__ for rule, _ in budget.aborted]
+            self.assertEqual(sorted(aborted), ["AnythingBy", "StartsWithList"])
+
+    def test_deadline(self):
+        now = [0]
+        for engine in [SequentialEngine, CombinedEngine, RegexEngine,
+                       MemoEngine]:
+            budget = MatchBudget(timeout=1, timer=lambda: now[0])
+            words = tagged("list/VB movie/NN")
+            now[0] = 2
+            matched = list(engine(self.rules).matches(
+                self.rules, eol_terminated(words), budget))
+            self.assertEqual(matched, [])
+            self.assertTrue(budget.timed_out)
+            self.assertTrue(budget.aborted)
+            now[0] = 0
+
+    def test_profile(self):
+        words = tagged("list/VB movie/NN by/IN Tom/NNP")
+        counters = []
+        for engine in [SequentialEngine, CombinedEngine, RegexEngine,
+                       MemoEngine]:
+            profile = RuleProfile()
+            list(engine(self.rules).matches(self.rules, eol_terminated(words),
+                                            profile=profile))
+            counters.append({name: (stats["attempts"], stats["matches"])
+                             for name, stats in profile.stats().items()})
+        self.assertEqual(counters[0]["MoviesBy"], (1, 1))
+        self.assertEqual(counters[0]["WhatIs"], (1, 0))
+        self.assertEqual(counters[1], counters[0])
+        self.assertEqual(counters[2], counters[0])
+        self.assertEqual(counters[3], counters[0])
+
+    def test_get_engine(self):
+        self.assertIsInstance(get_engine(self.rules, "combined"),
+                              CombinedEngine)
+        self.assertIsInstance(get_engine(self.rules, "regex"), RegexEngine)
+        self.assertIsInstance(get_engine(self.rules, "memo"), MemoEngine)
+        self.assertRaises(ValueError, get_engine, self.rules, "nonexistent")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) 2012, Machinalis S.R.L.
+# This file is part of quepy and is distributed under the Modified BSD License.
+# You should have received a copy of license in the LICENSE file.
+#
+# Authors: Rafael Carrascosa <rcarrascosa@machinalis.com>
+#          Gonzalo Garcia Berrotaran <ggarcia@machinalis.com>
+
+from __future__ import absolute_import, unicode_literals
+
+"""
+Tests that heavy modules are only imported when used.
+"""
+
+import os
+import sys
+import unittest
+import subprocess
+
+HEAVY_MODULES = ("nltk", "spacy", "sqlite3", "multiprocessing",
+                 "quepy.tagger", "quepy.nltktagger", "quepy.sparql_generation",
+                 "quepy.mql_generation", "quepy.dot_generation")
+
+
+def loaded_after(code):
+    tests_path = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.dirname(tests_path), tests_path,
+         env.get("PYTHONPATH", "")])
+
+    code += ("\nimport sys\n"
+             "print(' '.join(sorted(sys.modules)))\n")
+    output = subprocess.check_output([sys.executable, "-c", code], env=env)
+    modules = output.decode("utf-8").split()
+    return [name for name in modules
+            if name in HEAVY_MODULES or name.split(".")[0] in HEAVY_MODULES]
+
+
+class TestLazyImports(unittest.TestCase):
+    def test_import_quepy(self):
+        self.assertEqual(loaded_after("import quepy"), [])
+
+    def test_install(self):
+        self.assertEqual(loaded_after("import quepy\n"
+                                      "quepy.install('testapp')"), [])
+
+    def test_generation_on_first_use(self):
+        loaded = loaded_after("from quepy import generation\n"
+                              "from quepy.dsl import HasKeyword\n"
+                              "generation.get_code(HasKeyword('a'), 'sparql')")
+        self.assertEqual(loaded, ["quepy.sparql_generation"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -16,20 +16,52 @@ Tests for nltktagger.
 
 import unittest
 from quepy import nltktagger
-from quepy.tagger import Word
+from quepy.tagger import TaggedSentence, TaggedWord
 
 
 class TestNLTKTagger(unittest.TestCase):
     def test_word_output(self):
         output = nltktagger.run_nltktagger("this is a test case «¢ðßæŋħħ")
 
-        self.assertIsInstance(output, list)
+        self.assertIsInstance(output, TaggedSentence)
         for word in output:
-            self.assertIsInstance(word, Word)
+            self.assertIsInstance(word, TaggedWord)
 
     def tests_wrong_input(self):
         self.assertRaises(TypeError, nltktagger.run_nltktagger, b"this is not unicode")
 
+    def test_tag_many_same_output(self):
+        tagger = nltktagger.run_nltktagger()
+        questions = ["Who is Tom Cruise?", "list movies directed by Tarantino",
+                     "", "this is a test case «¢ðßæŋħħ"]
+
+        batched = list(tagger.tag_many(iter(questions), chunksize=3))
+        self.assertEqual(len(batched), len(questions))
+        for question, words in zip(questions, batched):
+            expected = [(w.token, w.lemma, w.pos) for w in tagger(question)]
+            self.assertEqual([(w.token, w.lemma, w.pos) for w in words],
+                             expected)
+
+    def test_lemma_cache(self):
+        tagger = nltktagger.run_nltktagger(lemma_cache_size=100)
+        tagger("movies movies movies")
+
+        self.assertEqual(tagger.lemma_cache.misses, 1)
+        self.assertEqual(tagger.lemma_cache.hits, 2)
+
+    def test_lemma_cache_size(self):
+        self.assertEqual(nltktagger.run_nltktagger().lemma_cache.maxsize, 10000)
+        tagger = nltktagger.run_nltktagger(lemma_cache_size=None)
+        self.assertIsNone(tagger.lemma_cache.maxsize)
+
+    def test_morphy_tag_table(self):
+        tagger = nltktagger.run_nltktagger()
+        self.assertEqual(tagger.penn_to_morphy_tag("NNS"), "n")
+        self.assertEqual(tagger.penn_to_morphy_tag("VBZ"), "v")
+        self.assertEqual(tagger.penn_to_morphy_tag("DT"), None)
+        # Not a penn tag but handled by prefix
+        self.assertEqual(tagger.penn_to_morphy_tag("JJ|CC"), "a")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -15,8 +15,13 @@ Tests for Regex module.
 """
 
 import unittest
-from quepy.parsing import QuestionTemplate, Particle, Lemma
-from quepy.tagger import Word
+from refo import Plus, Question, Disjunction, Star, Any, Group
+from quepy.parsing import QuestionTemplate, Particle, Lemma, Pos, Token, \
+    WordSpan, WordList, \
+    PosIn, LemmaIn, TokenIn, PossIn, LemmasIn, eol_terminated, \
+    collapse_alternations, compile_regex, run_compiled, MatchBudget, \
+    BudgetExceeded
+from quepy.tagger import Word, TaggedSentence
 
 
 class Mockrule(object):
@@ -48,6 +53,57 @@ class TestQuestionTemplate(unittest.TestCase):
         self.assertTrue(ir is self.mockrule)
         self.assertEqual(userdata, None)
 
+    def test_match_tagged_sentence(self):
+        words = TaggedSentence.from_words([Word("hi", "hello")])
+        ir, userdata = self.regexinstance.get_interpretation(words)
+        self.assertTrue(ir is self.mockrule)
+
+    def test_compiled_once(self):
+        words = [Word("hi", "hello")]
+        self.regexinstance.get_interpretation(words)
+        code = self.regexinstance._code
+        self.assertIsNot(code, None)
+
+        self.regexinstance.get_interpretation(words)
+        self.assertIs(self.regexinstance._code, code)
+
+    def test_shared_sequence(self):
+        words = [Word("hi", "hello")]
+        sequence = eol_terminated(words)
+        ir, _ = self.regexinstance.get_interpretation(words, sequence)
+        self.assertTrue(ir is self.mockrule)
+        ir, _ = self.regex_with_data.get_interpretation(words, sequence)
+        self.assertTrue(ir is self.mockrule)
+        self.assertIs(self.regexinstance.match(sequence[1:]), None)
+
+    def test_budget(self):
+        class AnyRegex(QuestionTemplate):
+            regex = Star(Any()) + Lemma("c")
+
+            def interpret(self, match):
+                return Mockrule
+
+        words = [Word(x, x) for x in "a b c".split()]
+        sequence = eol_terminated(words)
+        self.assertTrue(AnyRegex().match(sequence, MatchBudget(steps=100)))
+        self.assertRaises(BudgetExceeded, AnyRegex().match, sequence,
+                          MatchBudget(steps=2))
+
+        budget = MatchBudget(steps=2)
+        self.assertEqual(AnyRegex().get_interpretation(words, budget=budget),
+                         (None, None))
+        self.assertEqual(len(budget.aborted), 1)
+        self.assertFalse(budget.timed_out)
+
+    def test_deadline(self):
+        now = [0]
+        budget = MatchBudget(timeout=1, timer=lambda: now[0])
+        budget.check(1000)
+        self.assertFalse(budget.expired())
+        now[0] = 2
+        self.assertRaises(BudgetExceeded, budget.check, 0)
+        self.assertTrue(budget.timed_out)
+
     def test_no_match(self):
         words = [Word("hi", "hello"), Word("girl", "girl")]
         ir, userdata = self.regexinstance.get_interpretation(words)
@@ -119,6 +175,31 @@ class TestParticle(unittest.TestCase):
         self.assertEqual(match.person.words[0], words[0])
         self.assertRaises(AttributeError, lambda: match.pirulo)
 
+    def test_cached_attrs(self):
+        calls = []
+
+        class Person(Particle):
+            regex = Lemma("Jim")
+
+            def interpret(self, match):
+                calls.append(match)
+                return object()
+
+        class PersonRegex(QuestionTemplate):
+            regex = Person() + Lemma("be") + Group(Lemma("Tonny"), "other")
+
+            def interpret(self, match):
+                return match
+
+        words = [Word(x, x) for x in "Jim be Tonny".split()]
+        match, _ = PersonRegex().get_interpretation(words)
+        self.assertIs(match.person, match.person)
+        self.assertEqual(len(calls), 1)
+        self.assertIs(match.other, match.other)
+        self.assertIs(match.words, match.words)
+        self.assertEqual(match.words.tokens, "Jim be Tonny")
+        self.assertEqual(match.other.lemmas, "Tonny")
+
     def test_nested_particle(self):
         words = [Word(x, x) for x in "Jim 's car be Tonny".split()]
         match, _ = self.nestedregex.get_interpretation(words)
@@ -126,5 +207,105 @@ class TestParticle(unittest.TestCase):
         self.assertRaises(AttributeError, lambda: match.personasset.another)
 
 
+class TestWordSpan(unittest.TestCase):
+    def setUp(self):
+        self.words = TaggedSentence.from_words(
+            [Word(x, x.lower()) for x in "Who is Tom Cruise ?".split()])
+        self.span = WordSpan(self.words, 2, 4)
+
+    def test_sequence(self):
+        self.assertEqual(len(self.span), 2)
+        self.assertEqual([w.token for w in self.span], ["Tom", "Cruise"])
+        self.assertIs(self.span[0], self.words[2])
+        self.assertIs(self.span[-1], self.words[3])
+        self.assertRaises(IndexError, lambda: self.span[2])
+        self.assertEqual(self.span, list(self.words[2:4]))
+        self.assertNotEqual(self.span, list(self.words[1:3]))
+
+    def test_slices(self):
+        self.assertIsInstance(self.span[1:], WordSpan)
+        self.assertEqual(self.span[1:].tokens, "Cruise")
+        self.assertEqual(len(self.span[5:]), 0)
+        self.assertEqual(self.span[::-1], [self.words[3], self.words[2]])
+
+    def test_clipped(self):
+        span = WordSpan(self.words, 3, 10)
+        self.assertEqual(span.tokens, "Cruise ?")
+
+    def test_tokens_and_lemmas(self):
+        self.assertEqual(self.span.tokens, "Tom Cruise")
+        self.assertEqual(self.span.lemmas, "tom cruise")
+
+    def test_to_list(self):
+        words = self.span.to_list()
+        self.assertIsInstance(words, WordList)
+        self.assertEqual(words, list(self.words[2:4]))
+
+    def test_list_changes(self):
+        words = self.span.to_list()
+        self.assertEqual(words.tokens, "Tom Cruise")
+        words.append(self.words[4])
+        self.assertEqual(words.tokens, "Tom Cruise ?")
+        words[0] = self.words[0]
+        self.assertEqual(words.lemmas, "who cruise ?")
+
+
+class TestSetPredicates(unittest.TestCase):
+    def test_predicates(self):
+        word = Word("Movies", "movie", "NNS")
+        self.assertTrue(PosIn(["NN", "NNS"]).f(word))
+        self.assertFalse(PosIn(["NN", "NNP"]).f(word))
+        self.assertTrue(LemmaIn(["film", "movie"]).f(word))
+        self.assertTrue(TokenIn(["Movies"]).f(word))
+        self.assertFalse(TokenIn(["movies"]).f(word))
+        self.assertFalse(PosIn(["NN"]).f(None))
+
+    def test_helpers(self):
+        self.assertEqual(PossIn("NN NNS").tags, frozenset(["NN", "NNS"]))
+        self.assertIsInstance(LemmasIn("movie film"), LemmaIn)
+
+    def test_collapse(self):
+        regex = collapse_alternations(Pos("NN") | Pos("NNS") | Pos("NNP"))
+        self.assertIsInstance(regex, PosIn)
+        self.assertEqual(regex.tags, frozenset(["NN", "NNS", "NNP"]))
+
+        regex = collapse_alternations(Lemma("movie") | LemmaIn(["film"]))
+        self.assertEqual(regex.tags, frozenset(["movie", "film"]))
+
+    def test_collapse_mixed_attributes(self):
+        regex = Pos("NN") | Lemma("movie")
+        self.assertIs(collapse_alternations(regex), regex)
+
+        regex = collapse_alternations(Pos("NN") | Pos("NNS") | Token("x"))
+        self.assertIsInstance(regex, Disjunction)
+        self.assertIsInstance(regex.a, PosIn)
+
+    def test_collapse_nested(self):
+        class Movie(Particle):
+            regex = Question(Pos("DT")) + Plus(Pos("NN") | Pos("NNS"))
+
+        particle = Movie()
+        regex = collapse_alternations(Lemma("see") + particle)
+        group = regex.xs[1]
+        self.assertIs(group.key, particle)
+        self.assertIsInstance(group.x.xs[1].x, PosIn)
+        # The particle itself is not modified
+        self.assertIsInstance(particle.regex.xs[1].x, Disjunction)
+
+    def test_same_matches(self):
+        regex = Question(Pos("DT")) + Plus(Pos("NN") | Pos("NNS")) + \
+            (Lemma("be") | Lemma("have"))
+        for question in ["the/DT movie/NN be/VBZ", "movies/NNS have/VBZ",
+                         "the/DT be/VBZ", "movie/NN go/VBZ"]:
+            words = [Word(x.split("/")[0], x.split("/")[0], x.split("/")[1])
+                     for x in question.split()]
+            sequence = eol_terminated(words)
+            collapsed = run_compiled(compile_regex(regex), sequence)
+            plain = run_compiled(compile_regex(regex, collapse=False),
+                                 sequence)
+            self.assertEqual(collapsed and collapsed.state,
+                             plain and plain.state)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) 2012, Machinalis S.R.L.
+# This file is part of quepy and is distributed under the Modified BSD License.
+# You should have received a copy of license in the LICENSE file.
+#
+# Authors: Rafael Carrascosa <rcarrascosa@machinalis.com>
+#          Gonzalo Garcia Berrotaran <ggarcia@machinalis.com>
+
+from __future__ import absolute_import, unicode_literals
+
+"""
+Tests for the per template profiling counters.
+"""
+
+import io
+import unittest
+
+from quepy.parsing import QuestionTemplate, Lemma, BadSemantic
+from quepy.profiling import RuleProfile
+from quepy.tagger import Word
+
+
+class Cheap(QuestionTemplate):
+    regex = Lemma("a")
+
+    def interpret(self, match):
+        raise BadSemantic("never")
+
+
+class Expensive(QuestionTemplate):
+    regex = Lemma("b")
+
+
+class TestRuleProfile(unittest.TestCase):
+    def setUp(self):
+        self.profile = RuleProfile()
+
+    def test_counters(self):
+        self.profile.matched(Cheap(), None, 0.5)
+        self.profile.matched(Cheap(), object(), 0.25)
+        self.profile.interpreted(Cheap(), True, 0.125)
+        self.assertEqual(self.profile.stats(), {"Cheap": {
+            "attempts": 2, "matches": 1, "rejected": 1,
+            "match_time": 0.75, "interpret_time": 0.125}})
+
+    def test_by_cost(self):
+        self.profile.matched(Cheap(), None, 1)
+        self.profile.matched(Expensive(), None, 1)
+        self.profile.interpreted(Expensive(), False, 1)
+        self.assertEqual([name for name, _ in self.profile.by_cost()],
+                         ["Expensive", "Cheap"])
+
+        stream = io.StringIO()
+        self.profile.dump(stream)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith("Expensive"))
+
+    def test_reset(self):
+        self.profile.matched(Cheap(), None, 1)
+        self.profile.reset()
+        self.assertEqual(self.profile.stats(), {})
+
+    def test_get_interpretation(self):
+        now = [0]
+
+        def timer():
+            now[0] += 1
+            return now[0]
+
+        profile = RuleProfile(timer)
+        words = [Word("a", "a")]
+        self.assertEqual(Cheap().get_interpretation(words, profile=profile),
+                         (None, None))
+        Expensive().get_interpretation(words, profile=profile)
+        stats = profile.stats()
+        self.assertEqual(stats["Cheap"], {
+            "attempts": 1, "matches": 1, "rejected": 1,
+            "match_time": 1, "interpret_time": 1})
+        self.assertEqual(stats["Expensive"]["matches"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -19,6 +19,11 @@ from builtins import str
 import unittest
 
 import quepy
+from quepy.tagger import Word
+
+
+def fake_tagger(string):
+    return [Word(x, x.lower(), "NN") for x in string.split()]
 
 
 class TestQuepyApp(unittest.TestCase):
@@ -43,6 +48,220 @@ class TestQuepyApp(unittest.TestCase):
         target, query, userdata = self.app.get_query(question)
         self.assertEqual(userdata, 42)
 
+    def test_fake_tagger(self):
+        self.app.tagger = fake_tagger
+        target, query, userdata = self.app.get_query("user data")
+        self.assertEqual(userdata, "<user data>")
+
+        target, query, userdata = self.app.get_query("something else")
+        self.assertEqual(userdata, 42)
+        self.assertIn('"something"', query.lower())
+
+    def test_prefilter_stats(self):
+        self.app.tagger = fake_tagger
+        self.app.get_query("user data")
+        stats = self.app.stats()["prefilter"]
+        self.assertEqual(stats["questions"], 1)
+        self.assertEqual(stats["templates"], 3)
+
+    def test_combined_engine(self):
+        from quepy import settings
+        engine = settings.MATCHING_ENGINE
+        settings.MATCHING_ENGINE = "combined"
+        try:
+            app = quepy.install("testapp")
+        finally:
+            settings.MATCHING_ENGINE = engine
+        app.tagger = fake_tagger
+
+        queries = list(app.get_queries("user data"))
+        self.assertEqual([userdata for _, _, userdata in queries],
+                         ["<user data>", 42, None])
+
+    def test_limit(self):
+        self.app.tagger = fake_tagger
+        queries = list(self.app.get_queries("user data", limit=2))
+        self.assertEqual([userdata for _, _, userdata in queries],
+                         ["<user data>", 42])
+        self.assertEqual(list(self.app.get_queries("user data", limit=0)), [])
+
+    def test_tiered(self):
+        self.app.tagger = fake_tagger
+        queries = list(self.app.get_queries("user data", tiered=True))
+        self.assertEqual([userdata for _, _, userdata in queries],
+                         ["<user data>"])
+
+        # UserData can't match, the next weight with a match is used
+        queries = list(self.app.get_queries("some data", tiered=True))
+        self.assertEqual([userdata for _, _, userdata in queries], [42])
+
+    def test_tiered_same_weight(self):
+        for rule in self.app.rules:
+            rule.weight = 1
+        self.app.tagger = fake_tagger
+        queries = list(self.app.get_queries("user data", tiered=True))
+        self.assertEqual(len(queries), 3)
+
+    def test_step_budget(self):
+        from quepy import settings
+        self.app.tagger = fake_tagger
+        settings.MATCH_STEP_BUDGET = 3
+        try:
+            queries = list(self.app.get_queries("a long question to match"))
+        finally:
+            settings.MATCH_STEP_BUDGET = None
+
+        self.assertEqual(queries, [])
+        stats = self.app.stats()["budget"]
+        self.assertEqual(stats["aborted"], {"MatchAny": 1, "LowMatchAny": 1})
+        self.assertEqual(stats["timed_out"], 0)
+
+    def test_timeout(self):
+        from quepy import settings
+        self.app.tagger = fake_tagger
+        settings.MATCH_TIMEOUT = -1
+        try:
+            queries = list(self.app.get_queries("user data"))
+        finally:
+            settings.MATCH_TIMEOUT = None
+
+        self.assertEqual(queries, [])
+        stats = self.app.stats()["budget"]
+        self.assertEqual(stats["aborted"], {"UserData": 1})
+        self.assertEqual(stats["timed_out"], 1)
+
+    def test_profile(self):
+        from quepy import settings
+        settings.PROFILE_RULES = True
+        try:
+            app = quepy.install("testapp")
+        finally:
+            settings.PROFILE_RULES = False
+        app.tagger = fake_tagger
+
+        list(app.get_queries("user data"))
+        stats = app.stats()["rules"]
+        self.assertEqual(sorted(stats), ["LowMatchAny", "MatchAny", "UserData"])
+        self.assertEqual(stats["UserData"]["attempts"], 1)
+        self.assertEqual(stats["UserData"]["matches"], 1)
+
+        app.reset_stats()
+        self.assertEqual(app.stats()["rules"], {})
+        self.assertEqual(app.stats()["prefilter"]["questions"], 0)
+        self.assertEqual(self.app.stats()["rules"], {})
+
+    def test_batch(self):
+        def tagger(string):
+            if string == "fail":
+                raise ValueError("can't tag")
+            return fake_tagger(string)
+
+        self.app.tagger = tagger
+        questions = ["user data", "fail", "something else"] * 3
+        for executor in ["thread", "process"]:
+            results = list(self.app.get_queries_batch(
+                questions, workers=2, executor=executor, chunksize=2,
+                limit=1))
+            self.assertEqual([result.question for result in results],
+                             questions)
+            self.assertEqual(results[0].queries,
+                             list(self.app.get_queries("user data", limit=1)))
+            self.assertEqual(results[2].queries[0][2], 42)
+            self.assertIsNone(results[1].queries)
+            self.assertIsInstance(results[1].error, ValueError)
+
+    def test_batch_dedup(self):
+        calls = []
+
+        def tagger(string):
+            calls.append(string)
+            return fake_tagger(string)
+
+        self.app.tagger = tagger
+        questions = ["user data", "something", "user  data", "user data",
+                     "User data"]
+        results = list(self.app.get_queries_batch(
+            questions, workers=2, executor="thread", chunksize=1))
+        self.assertEqual([result.question for result in results], questions)
+        self.assertEqual(calls, ["user data", "something", "User data"])
+        self.assertEqual(results[2].queries, results[0].queries)
+        self.assertEqual(self.app.stats()["batch"], {
+            "questions": 5, "distinct": 3, "dedup_ratio": 0.4})
+
+        del calls[:]
+        results = list(self.app.get_queries_batch(
+            questions, workers=2, executor="thread", dedup=False))
+        self.assertEqual(len(calls), 5)
+        self.assertEqual(results[3].queries, results[0].queries)
+
+    def test_batch_dedup_size(self):
+        calls = []
+
+        def tagger(string):
+            calls.append(string)
+            return fake_tagger(string)
+
+        self.app.tagger = tagger
+        others = ["question {}".format(i) for i in range(10)]
+        questions = ["a", "b", "a"] + others + ["a", "b"] + ["a"] * 50
+        results = list(self.app.get_queries_batch(
+            questions, workers=1, executor="thread", chunksize=1,
+            dedup_size=2))
+        self.assertEqual([result.question for result in results], questions)
+        # Both were evicted by the other questions and translated again, the
+        # repeats of "a" after that reuse its result
+        self.assertEqual(calls, ["a", "b"] + others + ["a", "b"])
+        self.assertEqual(results[14].queries, results[1].queries)
+
+    def test_batch_settings(self):
+        from quepy import settings
+        self.app.tagger = fake_tagger
+        settings.MATCH_STEP_BUDGET = 3
+        try:
+            results = list(self.app.get_queries_batch(
+                ["a long question to match"], workers=1))
+        finally:
+            settings.MATCH_STEP_BUDGET = None
+        self.assertEqual(results[0].queries, [])
+
+    def test_batch_executor(self):
+        self.assertRaises(ValueError, list, self.app.get_queries_batch(
+            ["user data"], executor="nonexistent"))
+
+    def test_tagger_settings_per_app(self):
+        from types import ModuleType
+        from quepy import settings, tagger
+        from testapp import basic
+
+        def app_settings(name, backend):
+            module = ModuleType(name)
+            module.LANGUAGE = "sparql"
+            module.TAGGER = backend
+            module.TAG_CACHE = "lru"
+            return module
+
+        def backend(name):
+            def tag(string):
+                return [Word(name)]
+            return lambda config: tag
+
+        saved = settings.TAGGER, settings.TAG_CACHE
+        tagger.TAGGERS["a"] = backend("a")
+        tagger.TAGGERS["b"] = backend("b")
+        try:
+            # Installing the second app changes the global settings, the
+            # first app still builds its tagger from its own
+            first = quepy.QuepyApp(basic, app_settings("first", "a"))
+            second = quepy.QuepyApp(basic, app_settings("second", "b"))
+            self.assertEqual(first.tagger("x")[0].token, "a")
+            self.assertEqual(second.tagger("x")[0].token, "b")
+            self.assertIsInstance(first.tagger, tagger.CachedTagger)
+        finally:
+            settings.TAGGER, settings.TAG_CACHE = saved
+            del tagger.TAGGERS["a"]
+            del tagger.TAGGERS["b"]
+            tagger.clear_tagger_pool()
+
     def test_config_is_saved(self):
         from quepy import settings
         self.assertIn("testapp", settings.SPARQL_PREAMBLE)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) 2012, Machinalis S.R.L.
+# This file is part of quepy and is distributed under the Modified BSD License.
+# You should have received a copy of license in the LICENSE file.
+#
+# Authors: Rafael Carrascosa <rcarrascosa@machinalis.com>
+#          Gonzalo Garcia Berrotaran <ggarcia@machinalis.com>
+
+from __future__ import absolute_import, unicode_literals
+
+"""
+Tests for incremental matching sessions.
+"""
+
+import unittest
+from refo import Star, Predicate
+
+import quepy
+from quepy.parsing import QuestionTemplate, eol_terminated
+from quepy.session import MatchSession
+from quepy.tagger import Word
+from movie_rules import ListMovies, MoviesBy, StartsWithList, AnythingBy, \
+    tagged
+
+
+class FakeApp(object):
+    profile = None
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.tagger = tagged
+
+
+def names(rules):
+    return [type(rule).__name__ for rule in rules]
+
+
+class TestMatchSession(unittest.TestCase):
+    def setUp(self):
+        self.rules = [ListMovies(), MoviesBy(), StartsWithList(),
+                      AnythingBy()]
+        self.session = MatchSession(FakeApp(self.rules))
+
+    def accepting(self):
+        return [(type(rule).__name__, match.state)
+                for rule, match in self.session.accepting()]
+
+    def test_viable_and_accepting(self):
+        self.assertEqual(names(self.session.viable()), names(self.rules))
+        self.assertEqual(self.accepting(), [])
+
+        self.session.append("list/VB")
+        self.assertEqual(names(self.session.viable()),
+                         ["ListMovies", "MoviesBy", "StartsWithList",
+                          "AnythingBy"])
+        self.assertEqual([name for name, _ in self.accepting()],
+                         ["StartsWithList"])
+
+        self.session.append(" movie/NN")
+        self.assertEqual([name for name, _ in self.accepting()],
+                         ["ListMovies", "StartsWithList"])
+
+        self.session.append(" by/IN")
+        self.assertEqual(names(self.session.viable()),
+                         ["MoviesBy", "StartsWithList", "AnythingBy"])
+        self.assertEqual([name for name, _ in self.accepting()],
+                         ["StartsWithList"])
+
+        self.session.append(" Tarantino/NNP")
+        self.assertEqual([name for name, _ in self.accepting()],
+                         ["MoviesBy", "StartsWithList", "AnythingBy"])
+        self.assertEqual(self.session.text, "list/VB movie/NN by/IN "
+                                            "Tarantino/NNP")
+
+    def test_same_as_match(self):
+        question = "list/VB movie/NN by/IN Quentin/NNP Tarantino/NNP"
+        words = tagged(question)
+        for i, item in enumerate(question.split()):
+            self.session.append(" " + item)
+            sequence = eol_terminated(words[:i + 1])
+            expected = [(type(rule).__name__, match.state)
+                        for rule, match in
+                        ((rule, rule.match(sequence)) for rule in self.rules)
+                        if match]
+            self.assertEqual(self.accepting(), expected)
+
+    def test_only_new_words_are_fed(self):
+        checked = []
+
+        def word(word):
+            checked.append(word.token)
+            return True
+
+        class Words(QuestionTemplate):
+            regex = Star(Predicate(word))
+
+        session = MatchSession(FakeApp([Words()]))
+        session.append("list/VB movie/NN")
+        session.append(" by/IN")
+        self.assertEqual(checked, ["list", "movie", "by"])
+
+        del checked[:]
+        session.update("list/VB film/NN by/IN Tom/NNP")
+        self.assertEqual(checked, ["film", "by", "Tom"])
+        self.assertEqual(len(session.words), 4)
+
+    def test_update_rewinds(self):
+        self.session.update("list/VB movie/NN by/IN")
+        self.assertEqual(names(self.session.viable()),
+                         ["MoviesBy", "StartsWithList", "AnythingBy"])
+        self.session.update("list/VB")
+        self.assertEqual(names(self.session.viable()), names(self.rules))
+        self.session.update("")
+        self.assertEqual(len(self.session.words), 0)
+        self.assertEqual(self.accepting(), [])
+
+
+class TestAppSession(unittest.TestCase):
+    def test_get_queries(self):
+        app = quepy.install("testapp")
+        app.tagger = lambda text: [Word(x, x.lower(), "NN")
+                                   for x in text.split()]
+        session = app.session()
+        session.append("user")
+        session.append(" data")
+        self.assertEqual(list(session.get_queries()),
+                         list(app.get_queries("user data")))
+        self.assertEqual(len(list(session.get_queries(limit=1))), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
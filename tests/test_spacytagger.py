@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright (c) 2012, Machinalis S.R.L.
+# This file is part of quepy and is distributed under the Modified BSD License.
+# You should have received a copy of license in the LICENSE file.
+#
+# Authors: Rafael Carrascosa <rcarrascosa@machinalis.com>
+#          Gonzalo Garcia Berrotaran <ggarcia@machinalis.com>
+
+from __future__ import absolute_import, unicode_literals
+
+"""
+Tests for spacytagger.
+"""
+
+import unittest
+from quepy.tagger import TaggedSentence, TaggedWord
+
+try:
+    from quepy import spacytagger
+except ImportError:
+    spacytagger = None
+
+
+@unittest.skipIf(spacytagger is None, "spaCy is not installed")
+class TestSpacyTagger(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tagger = spacytagger.run_spacytagger()
+
+    def test_word_output(self):
+        output = self.tagger("this is a test case «¢ðßæŋħħ")
+
+        self.assertIsInstance(output, TaggedSentence)
+        for word in output:
+            self.assertIsInstance(word, TaggedWord)
+
+    def tests_wrong_input(self):
+        self.assertRaises(TypeError, self.tagger, b"this is not unicode")
+
+    def test_unused_components(self):
+        for name in spacytagger.UNUSED_COMPONENTS:
+            self.assertNotIn(name, self.tagger.nlp.pipe_names)
+
+    def test_tag_many_same_output(self):
+        questions = ["Who is Tom Cruise?", "list movies directed by Tarantino",
+                     ""]
+
+        batched = list(self.tagger.tag_many(iter(questions), chunksize=2))
+        self.assertEqual(len(batched), len(questions))
+        for question, words in zip(questions, batched):
+            expected = [(w.token, w.lemma, w.pos) for w in self.tagger(question)]
+            self.assertEqual([(w.token, w.lemma, w.pos) for w in words],
+                             expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -15,8 +15,12 @@ Tests for tagger.
 
 from builtins import str
 
+import sys
+import pickle
 import unittest
-from quepy import tagger
+import subprocess
+from quepy import tagger, settings
+from quepy.cache import LRUCache
 
 au = "æßđħłłþłłł@æµß"
 bu = "ŧłþłßæ#¶ŋħ~#~@"
@@ -73,5 +77,226 @@ class TestTagger(unittest.TestCase):
         self.assertRaises(TypeError, setattr, word, "pos", cb)
 
 
+class FakeBackend(object):
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, string):
+        self.calls += 1
+        return [tagger.Word(x, x.lower(), "NN") for x in string.split()]
+
+
+class FakeBatchBackend(FakeBackend):
+    def __init__(self):
+        super(FakeBatchBackend, self).__init__()
+        self.chunks = []
+
+    def tag_many(self, strings, chunksize=None):
+        chunksize = chunksize or 2
+        strings = list(strings)
+        for i in range(0, len(strings), chunksize):
+            chunk = strings[i:i + chunksize]
+            self.chunks.append(len(chunk))
+            for string in chunk:
+                yield [tagger.Word(x, x.lower(), "NN") for x in string.split()]
+
+
+def _as_tuples(words):
+    return [(w.token, w.lemma, w.pos) for w in words]
+
+
+class TestTaggerWrapper(unittest.TestCase):
+    questions = ["Who is Tom Cruise", "list movies", "", "What is this"]
+
+    def test_call(self):
+        wrapper = tagger.TaggerWrapper(FakeBackend())
+        words = wrapper("list movies")
+        self.assertEqual(_as_tuples(words),
+                         [("list", "list", "NN"), ("movies", "movies", "NN")])
+
+    def test_tag_many_fallback(self):
+        backend = FakeBackend()
+        wrapper = tagger.TaggerWrapper(backend)
+        result = [_as_tuples(x) for x in wrapper.tag_many(self.questions)]
+        expected = [_as_tuples(wrapper(x)) for x in self.questions]
+        self.assertEqual(result, expected)
+
+    def test_tag_many_batches(self):
+        backend = FakeBatchBackend()
+        wrapper = tagger.TaggerWrapper(backend)
+        tagged = wrapper.tag_many(iter(self.questions), chunksize=3)
+        result = [_as_tuples(x) for x in tagged]
+        expected = [_as_tuples(wrapper(x)) for x in self.questions]
+        self.assertEqual(result, expected)
+        self.assertEqual(backend.chunks, [3, 1])
+
+
+class TestCachedTagger(unittest.TestCase):
+    def test_normalize_question(self):
+        self.assertEqual(tagger.normalize_question("  Who is\tTom  Cruise? "),
+                         "Who is Tom Cruise?")
+
+    def test_cache_hit(self):
+        backend = FakeBackend()
+        cached = tagger.CachedTagger(tagger.TaggerWrapper(backend), LRUCache(10))
+        first = cached("Who is Tom Cruise")
+        second = cached("Who  is Tom Cruise ")
+
+        self.assertEqual(backend.calls, 1)
+        self.assertEqual(_as_tuples(first), _as_tuples(second))
+        self.assertEqual(cached.cache.info().hits, 1)
+
+    def test_cached_words_are_read_only(self):
+        cached = tagger.CachedTagger(tagger.TaggerWrapper(FakeBackend()),
+                                     LRUCache(10))
+        words = cached("list movies")
+        self.assertIsInstance(words, tagger.TaggedSentence)
+        self.assertRaises(AttributeError, setattr, words[0], "lemma",
+                          "changed")
+
+        self.assertEqual(_as_tuples(cached("list movies")),
+                         [("list", "list", "NN"), ("movies", "movies", "NN")])
+
+    def test_tag_many(self):
+        backend = FakeBatchBackend()
+        cached = tagger.CachedTagger(tagger.TaggerWrapper(backend), LRUCache(10))
+        cached("list movies")
+        questions = ["list movies", "Who is Tom Cruise", "list  movies"]
+
+        result = [_as_tuples(x) for x in cached.tag_many(questions)]
+        self.assertEqual(result, [_as_tuples(cached(x)) for x in questions])
+        self.assertEqual(backend.chunks, [1])
+
+    def test_namespace(self):
+        cache = LRUCache(10)
+        backend = FakeBackend()
+        nltk = tagger.CachedTagger(tagger.TaggerWrapper(backend), cache,
+                                   "nltk")
+        spacy = tagger.CachedTagger(tagger.TaggerWrapper(backend), cache,
+                                    "spacy")
+        nltk("list movies")
+        spacy("list movies")
+        nltk("list  movies")
+        self.assertEqual(backend.calls, 2)
+        self.assertEqual(len(cache), 2)
+
+    def test_tag_cache_namespace(self):
+        old = settings.TAGGER, settings.SPACY_MODEL
+        try:
+            settings.TAGGER = "nltk"
+            nltk = tagger.tag_cache_namespace()
+            settings.TAGGER = "spacy"
+            spacy = tagger.tag_cache_namespace()
+            settings.SPACY_MODEL = "other_model"
+            other = tagger.tag_cache_namespace()
+        finally:
+            settings.TAGGER, settings.SPACY_MODEL = old
+        self.assertEqual(len(set([nltk, spacy, other])), 3)
+
+
+class TestTaggedSentence(unittest.TestCase):
+    def setUp(self):
+        self.words = [tagger.Word("Who", "who", "WP"),
+                      tagger.Word("is", "be", "VBZ", 0.5),
+                      tagger.Word("Tom", "tom", "NNP")]
+
+    def test_from_words(self):
+        sentence = tagger.TaggedSentence.from_words(self.words)
+        self.assertEqual(len(sentence), 3)
+        self.assertEqual(sentence.tokens, ("Who", "is", "Tom"))
+        self.assertEqual(sentence.lemmas, ("who", "be", "tom"))
+        self.assertEqual(sentence.pos_tags, ("WP", "VBZ", "NNP"))
+        self.assertEqual(sentence.probs, (None, 0.5, None))
+
+    def test_from_sentence(self):
+        sentence = tagger.TaggedSentence.from_words(self.words)
+        self.assertIs(tagger.TaggedSentence.from_words(sentence), sentence)
+
+    def test_views(self):
+        sentence = tagger.TaggedSentence.from_words(self.words)
+        self.assertIs(sentence[1], sentence[1])
+        self.assertEqual(_as_tuples(sentence), _as_tuples(self.words))
+        self.assertEqual(_as_tuples(sentence[1:]), _as_tuples(self.words[1:]))
+        self.assertRaises(AttributeError, setattr, sentence[0], "lemma", "x")
+        self.assertEqual(str(sentence[1]), "is|be|VBZ|0.5")
+
+    def test_interned(self):
+        sentence = tagger.TaggedSentence.from_words(self.words)
+        other = tagger.TaggedSentence.from_words(
+            [tagger.Word("".join(["W", "ho"]), "who", "".join(["W", "P"]))])
+        self.assertIs(sentence[0].token, other[0].token)
+        self.assertIs(sentence[0].pos, other[0].pos)
+
+    def test_pickle(self):
+        sentence = tagger.TaggedSentence.from_words(self.words)
+        other = pickle.loads(pickle.dumps(sentence))
+        self.assertEqual(_as_tuples(other), _as_tuples(sentence))
+        self.assertIs(other[0].pos, sentence[0].pos)
+
+    def test_to_words(self):
+        words = tagger.TaggedSentence.from_words(self.words).to_words()
+        for word in words:
+            self.assertIsInstance(word, tagger.Word)
+        self.assertEqual(_as_tuples(words), _as_tuples(self.words))
+
+    def test_wrong_lengths(self):
+        self.assertRaises(ValueError, tagger.TaggedSentence,
+                          ["a", "b"], ["a"], ["DT", "DT"])
+
+
+class TestGetTagger(unittest.TestCase):
+    def setUp(self):
+        self.tagger_name = settings.TAGGER
+        self.lemma_cache_size = settings.LEMMA_CACHE_SIZE
+        tagger.TAGGERS["fake"] = lambda config: FakeBackend()
+        tagger.clear_tagger_pool()
+
+    def tearDown(self):
+        settings.TAGGER = self.tagger_name
+        settings.LEMMA_CACHE_SIZE = self.lemma_cache_size
+        del tagger.TAGGERS["fake"]
+        tagger.clear_tagger_pool()
+
+    def test_registry(self):
+        settings.TAGGER = "fake"
+        wrapper = tagger.get_tagger()
+        self.assertIsInstance(wrapper, tagger.TaggerWrapper)
+        self.assertIsInstance(wrapper.tagger_function, FakeBackend)
+
+    def test_shared(self):
+        settings.TAGGER = "fake"
+        first = tagger.get_tagger()
+        self.assertIs(tagger.get_tagger(), first)
+        self.assertIsNot(tagger.get_tagger(shared=False), first)
+
+        settings.LEMMA_CACHE_SIZE = 1
+        self.assertIsNot(tagger.get_tagger(), first)
+
+        tagger.clear_tagger_pool()
+        settings.LEMMA_CACHE_SIZE = self.lemma_cache_size
+        self.assertIsNot(tagger.get_tagger(), first)
+
+    def test_warmup(self):
+        settings.TAGGER = "fake"
+        wrapper = tagger.get_tagger()
+        wrapper.warmup()
+        self.assertEqual(wrapper.tagger_function.calls, 1)
+
+    def test_unknown_tagger(self):
+        settings.TAGGER = "nonexistent"
+        self.assertRaises(ValueError, tagger.get_tagger)
+
+    def test_backend_imported_lazily(self):
+        code = ("import sys\n"
+                "from quepy import tagger, settings\n"
+                "tagger.TAGGERS['fake'] = lambda config: (lambda string: [])\n"
+                "settings.TAGGER = 'fake'\n"
+                "tagger.get_tagger()\n"
+                "loaded = [m for m in sys.modules\n"
+                "          if m.split('.')[0] in ('nltk', 'spacy')]\n"
+                "assert not loaded, loaded\n")
+        subprocess.check_call([sys.executable, "-c", code])
+
+
 if __name__ == "__main__":
     unittest.main()